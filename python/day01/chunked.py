@@ -0,0 +1,118 @@
+"""
+Author : Ken Youens-Clark <kyclark@gmail.com>
+Date   : 2021-12-01
+Purpose: Chunked, memory-mapped number readers shared by both solutions
+"""
+
+import mmap
+import os
+import numpy as np
+from typing import Iterator, List, Optional, TextIO, Tuple
+
+CHUNK_SIZE = 64 * 1024 * 1024
+
+
+# --------------------------------------------------
+def file_ranges(fh: TextIO, num: int) -> List[Tuple[int, int]]:
+    """ Split a file into about num byte ranges on line boundaries """
+
+    if os.fstat(fh.fileno()).st_size == 0:
+        return []
+
+    with mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ) as buf:
+        return split_ranges(buf, num)
+
+
+# --------------------------------------------------
+def split_ranges(buf, num: int) -> List[Tuple[int, int]]:
+    """ Split a buffer into about num byte ranges on line boundaries """
+
+    size = len(buf)
+    bounds = [0]
+    for i in range(1, num):
+        pos = max(bounds[-1], i * size // num)
+        bounds.append(buf.find(b'\n', pos) + 1 or size)
+    bounds.append(size)
+
+    return [(start, stop) for start, stop in zip(bounds, bounds[1:])
+            if stop > start]
+
+
+# --------------------------------------------------
+def test_split_ranges() -> None:
+    """ Test split_ranges """
+
+    data = b'1\n22\n333\n4444\n'
+
+    assert split_ranges(data, 1) == [(0, len(data))]
+    assert split_ranges(data, 2) == [(0, 9), (9, 14)]
+    assert split_ranges(data, 100)[-1][1] == len(data)
+    assert split_ranges(b'', 4) == []
+
+    for num in range(1, 20):
+        ranges = split_ranges(data, num)
+        assert b''.join(data[start:stop] for start, stop in ranges) == data
+        assert all(data[stop - 1:stop] == b'\n' for _, stop in ranges)
+
+
+# --------------------------------------------------
+def read_range(filename: str,
+               start: int = 0,
+               stop: Optional[int] = None,
+               chunk_size: int = CHUNK_SIZE) -> Iterator[np.ndarray]:
+    """ Read the numbers in a byte range of a file, a chunk at a time """
+
+    with open(filename, 'rb') as fh:
+        if os.fstat(fh.fileno()).st_size == 0:
+            return
+
+        with mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ) as buf:
+            yield from read_chunks(buf, chunk_size, start, stop)
+
+
+# --------------------------------------------------
+def read_chunks(buf,
+                chunk_size: int = CHUNK_SIZE,
+                start: int = 0,
+                stop: Optional[int] = None) -> Iterator[np.ndarray]:
+    """ Read the numbers in a bytes-like buffer, a chunk at a time """
+
+    stop = len(buf) if stop is None else stop
+
+    while start < stop:
+        # End each chunk on a line boundary so no number is split
+        end = buf.rfind(b'\n', start, min(start + chunk_size, stop)) + 1
+        if end <= start or start + chunk_size >= stop:
+            end = buf.find(b'\n', start + chunk_size, stop) + 1 or stop
+
+        yield np.fromstring(buf[start:end], dtype=np.int64, sep=' ')
+        start = end
+
+
+# --------------------------------------------------
+def test_read_chunks(tmp_path) -> None:
+    """ Test read_chunks and read_range """
+
+    data = b'199\n200\n208\n210\n200\n207\n240\n269\n260\n263\n'
+    nums = [199, 200, 208, 210, 200, 207, 240, 269, 260, 263]
+
+    assert list(read_chunks(b'', 10)) == []
+    assert [c.tolist() for c in read_chunks(data, 8)] == [
+        nums[i:i + 2] for i in range(0, 10, 2)
+    ]
+    assert [c.tolist() for c in read_chunks(data, 1024, 4, 16)] == [
+        [200, 208, 210]
+    ]
+
+    for chunk_size in range(1, len(data) + 1):
+        for text in [data, data.rstrip()]:
+            chunks = read_chunks(text, chunk_size)
+            assert np.concatenate(list(chunks)).tolist() == nums
+
+    filename = tmp_path / 'depths.txt'
+    filename.write_bytes(data)
+    assert np.concatenate(list(read_range(str(filename), 4, 16,
+                                          5))).tolist() == [200, 208, 210]
+
+    filename.write_bytes(b'')
+    assert list(read_range(str(filename))) == []
@@ -6,12 +6,27 @@ Purpose: Rock the Casbah
 """
 
 import argparse
-from typing import NamedTuple, TextIO
+import numpy as np
+from chunked import CHUNK_SIZE, file_ranges, read_chunks, read_range
+from functools import reduce
+from multiprocessing import Pool
+from typing import Iterable, NamedTuple, Optional, TextIO
 
 
 class Args(NamedTuple):
     """ Command-line arguments """
     file: TextIO
+    batch: bool
+    chunk_size: int
+    jobs: int
+    quiet: bool
+
+
+class Segment(NamedTuple):
+    """ Increases within a run of measurements and its end values """
+    increases: int
+    first: Optional[int]
+    last: Optional[int]
 
 
 # --------------------------------------------------
@@ -27,9 +42,40 @@ def get_args() -> Args:
                         metavar='FILE',
                         type=argparse.FileType('rt'))
 
+    parser.add_argument('-b',
+                        '--batch',
+                        help='Count with memory-mapped, vectorized chunks',
+                        action='store_true')
+
+    parser.add_argument('-c',
+                        '--chunk-size',
+                        help='Batch chunk size in bytes',
+                        metavar='INT',
+                        type=int,
+                        default=CHUNK_SIZE)
+
+    parser.add_argument('-j',
+                        '--jobs',
+                        help='Number of processes for batch counting',
+                        metavar='INT',
+                        type=int,
+                        default=1)
+
+    parser.add_argument('-q',
+                        '--quiet',
+                        help='Do not print each measurement',
+                        action='store_true')
+
     args = parser.parse_args()
 
-    return Args(args.file)
+    if args.chunk_size < 1:
+        parser.error(f'--chunk-size "{args.chunk_size}" must be > 0')
+
+    if args.jobs < 1:
+        parser.error(f'--jobs "{args.jobs}" must be > 0')
+
+    return Args(args.file, args.batch or args.jobs > 1, args.chunk_size,
+                args.jobs, args.quiet)
 
 
 # --------------------------------------------------
@@ -37,14 +83,24 @@ def main() -> None:
     """ Make a jazz noise here """
 
     args = get_args()
+
+    if args.batch:
+        num_increased = count_increases(args.file, args.chunk_size,
+                                        args.jobs)
+        print(f'{num_increased} increase')
+        return
+
     prev = ''
     num_increased = 0
 
     for num in map(lambda n: int(n.rstrip()), args.file):
         if prev == '':
-            print('(N/A - no previous measurement)')
+            if not args.quiet:
+                print('(N/A - no previous measurement)')
         else:
-            print('{} ({}creased)'.format(num, 'in' if num > prev else 'de'))
+            if not args.quiet:
+                print('{} ({}creased)'.format(num,
+                                             'in' if num > prev else 'de'))
             if num > prev:
                 num_increased += 1
 
@@ -52,6 +108,90 @@ def main() -> None:
 
     print(f'{num_increased} increase')
 
+
+# --------------------------------------------------
+def count_increases(fh: TextIO, chunk_size: int, jobs: int = 1) -> int:
+    """ Count increases by memory-mapping the file """
+
+    if jobs == 1:
+        return count_range(fh.name, 0, None, chunk_size).increases
+
+    with Pool(jobs) as pool:
+        segments = pool.starmap(count_range,
+                                [(fh.name, start, stop, chunk_size)
+                                 for start, stop in file_ranges(fh, jobs)])
+
+    return reduce(merge, segments, Segment(0, None, None)).increases
+
+
+# --------------------------------------------------
+def count_range(filename: str, start: int, stop: Optional[int],
+                chunk_size: int) -> Segment:
+    """ Count increases in one byte range of a file """
+
+    return count_chunks(read_range(filename, start, stop, chunk_size))
+
+
+# --------------------------------------------------
+def count_chunks(chunks: Iterable[np.ndarray]) -> Segment:
+    """ Count increases over consecutive chunks of measurements """
+
+    segment = Segment(0, None, None)
+
+    for nums in chunks:
+        if len(nums):
+            segment = merge(
+                segment,
+                Segment(int(np.count_nonzero(np.diff(nums) > 0)),
+                        int(nums[0]), int(nums[-1])))
+
+    return segment
+
+
+# --------------------------------------------------
+def test_count_chunks() -> None:
+    """ Test count_chunks """
+
+    data = b'199\n200\n208\n210\n200\n207\n240\n269\n260\n263\n'
+
+    assert count_chunks(read_chunks(b'', 10)) == (0, None, None)
+    assert count_chunks(read_chunks(b'1\n', 10)) == (0, 1, 1)
+    assert count_chunks(read_chunks(data, 1024)) == (7, 199, 263)
+    assert count_chunks(read_chunks(data, 1024, 4, 16)) == (2, 200, 210)
+
+    for chunk_size in range(1, len(data) + 1):
+        assert count_chunks(read_chunks(data, chunk_size)).increases == 7
+
+
+# --------------------------------------------------
+def merge(left: Segment, right: Segment) -> Segment:
+    """ Combine the counts of two adjacent runs of measurements """
+
+    if left.last is None:
+        return right
+
+    if right.first is None:
+        return left
+
+    # Carry the last value over to compare with the next run
+    return Segment(
+        left.increases + right.increases + int(right.first > left.last),
+        left.first, right.last)
+
+
+# --------------------------------------------------
+def test_merge() -> None:
+    """ Test merge """
+
+    empty = Segment(0, None, None)
+
+    assert merge(empty, empty) == empty
+    assert merge(empty, Segment(1, 2, 3)) == Segment(1, 2, 3)
+    assert merge(Segment(1, 2, 3), empty) == Segment(1, 2, 3)
+    assert merge(Segment(1, 2, 3), Segment(2, 4, 5)) == Segment(4, 2, 5)
+    assert merge(Segment(1, 2, 3), Segment(2, 3, 5)) == Segment(3, 2, 5)
+
+
 # --------------------------------------------------
 if __name__ == '__main__':
     main()
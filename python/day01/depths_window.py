@@ -6,13 +6,29 @@ Purpose: Rock the Casbah
 """
 
 import argparse
-from typing import NamedTuple, TextIO
+import re
+import numpy as np
+from chunked import CHUNK_SIZE, file_ranges, read_range
+from collections import deque
+from functools import partial, reduce
+from multiprocessing import Pool
+from typing import (Iterable, Iterator, List, NamedTuple, Optional, TextIO,
+                    Tuple)
 
 
 class Args(NamedTuple):
     """ Command-line arguments """
     file: TextIO
-    window: int
+    windows: List[int]
+    chunk_size: int
+    jobs: int
+
+
+class Segment(NamedTuple):
+    """ Increases per window size within a run and its end values """
+    increases: np.ndarray
+    head: np.ndarray
+    tail: np.ndarray
 
 
 # --------------------------------------------------
@@ -30,14 +46,69 @@ def get_args() -> Args:
 
     parser.add_argument('-w',
                         '--window',
-                        help='Window size',
+                        help='Window size(s), e.g., "3" or "1,3,5..1000"',
+                        metavar='STR',
+                        type=str,
+                        default='3')
+
+    parser.add_argument('-c',
+                        '--chunk-size',
+                        help='Chunk size in bytes for counting many windows',
+                        metavar='INT',
+                        type=int,
+                        default=CHUNK_SIZE)
+
+    parser.add_argument('-j',
+                        '--jobs',
+                        help='Number of processes for counting',
                         metavar='INT',
                         type=int,
-                        default=3)
+                        default=1)
 
     args = parser.parse_args()
 
-    return Args(args.file, args.window)
+    windows = parse_windows(args.window)
+    if not windows:
+        parser.error(f'Invalid --window "{args.window}"')
+
+    if args.chunk_size < 1:
+        parser.error(f'--chunk-size "{args.chunk_size}" must be > 0')
+
+    if args.jobs < 1:
+        parser.error(f'--jobs "{args.jobs}" must be > 0')
+
+    return Args(args.file, windows, args.chunk_size, args.jobs)
+
+
+# --------------------------------------------------
+def parse_windows(val: str) -> List[int]:
+    """ Parse a list of window sizes and inclusive ranges """
+
+    windows = []
+    for part in val.split(','):
+        if match := re.search(r'^\s*(\d+)\s*(?:\.\.\s*(\d+)\s*)?$', part):
+            start = int(match.group(1))
+            stop = int(match.group(2) or start)
+            if start < 1 or stop < start:
+                return []
+            windows.extend(range(start, stop + 1))
+        else:
+            return []
+
+    return sorted(set(windows))
+
+
+# --------------------------------------------------
+def test_parse_windows() -> None:
+    """ Test parse_windows """
+
+    assert parse_windows('3') == [3]
+    assert parse_windows('1,3,5..8') == [1, 3, 5, 6, 7, 8]
+    assert parse_windows('3, 1..3') == [1, 2, 3]
+    assert parse_windows('') == []
+    assert parse_windows('0') == []
+    assert parse_windows('5..1') == []
+    assert parse_windows('a') == []
 
 
 # --------------------------------------------------
@@ -45,26 +116,190 @@ def main() -> None:
     """ Make a jazz noise here """
 
     args = get_args()
-    window = []
-    num_increased = 0
 
-    for num in map(lambda n: int(n.rstrip()), args.file):
-        if len(window) < args.window:
-            window.append(num)
-            continue
+    if args.jobs > 1 or len(args.windows) > 1:
+        counts = count_windows(args.file, args.windows, args.chunk_size,
+                               args.jobs)
+        if len(args.windows) == 1:
+            print(f'{counts[0]} increase')
+        else:
+            for size, num_increased in zip(args.windows, counts):
+                print(f'window {size}: {num_increased} increase')
+        return
 
-        prev = sum(window)
-        window.pop(0)
-        window.append(num)
-        this = sum(window)
+    num_increased = 0
 
-        print('{} ({}creased)'.format(num, 'in' if this > prev else 'de'))
-        if this > prev:
+    for num, increased in compare_windows(
+            map(lambda n: int(n.rstrip()), args.file), args.windows[0]):
+        print('{} ({}creased)'.format(num, 'in' if increased else 'de'))
+        if increased:
             num_increased += 1
 
     print(f'{num_increased} increase')
 
 
+# --------------------------------------------------
+def compare_windows(nums: Iterable[int],
+                    size: int) -> Iterator[Tuple[int, bool]]:
+    """ Yield each number past the first window and if the sum increased """
+
+    # Consecutive windows share all but their end values, so the sum
+    # increases exactly when the incoming value beats the one leaving
+    window = deque(maxlen=size)
+
+    for num in nums:
+        if len(window) == size:
+            yield num, num > window[0]
+
+        window.append(num)
+
+
+# --------------------------------------------------
+def test_compare_windows() -> None:
+    """ Test compare_windows """
+
+    nums = [199, 200, 208, 210, 200, 207, 240, 269, 260, 263]
+
+    assert len([inc for _, inc in compare_windows(nums, 1) if inc]) == 7
+    assert len([inc for _, inc in compare_windows(nums, 3) if inc]) == 5
+    assert list(compare_windows(nums[:4], 3)) == [(210, True)]
+    assert list(compare_windows(nums[:3], 3)) == []
+
+
+# --------------------------------------------------
+def sweep_windows(nums: np.ndarray,
+                  sizes: List[int]) -> Iterator[Tuple[int, int]]:
+    """ Yield the number of increases for each window size """
+
+    # As in compare_windows, window sums differ only by their end values
+    for size in sizes:
+        yield size, int(np.count_nonzero(nums[size:] > nums[:-size]))
+
+
+# --------------------------------------------------
+def test_sweep_windows() -> None:
+    """ Test sweep_windows """
+
+    nums = np.array([199, 200, 208, 210, 200, 207, 240, 269, 260, 263])
+
+    assert list(sweep_windows(nums, [1, 3])) == [(1, 7), (3, 5)]
+    assert list(sweep_windows(nums, [9, 10, 11])) == [(9, 1), (10, 0),
+                                                      (11, 0)]
+    for size in range(1, 12):
+        assert dict(sweep_windows(nums, [size]))[size] == len(
+            [inc for _, inc in compare_windows(nums.tolist(), size) if inc])
+
+
+# --------------------------------------------------
+def count_windows(fh: TextIO, sizes: List[int], chunk_size: int,
+                  jobs: int) -> List[int]:
+    """ Count increases for each window size, in processes if wanted """
+
+    if jobs == 1:
+        return count_range(fh.name, 0, None, sizes,
+                           chunk_size).increases.tolist()
+
+    with Pool(jobs) as pool:
+        segments = pool.starmap(count_range,
+                                [(fh.name, start, stop, sizes, chunk_size)
+                                 for start, stop in file_ranges(fh, jobs)])
+
+    total = reduce(partial(merge, sizes=sizes), segments, empty(sizes))
+    return total.increases.tolist()
+
+
+# --------------------------------------------------
+def count_range(filename: str, start: int, stop: Optional[int],
+                sizes: List[int], chunk_size: int) -> Segment:
+    """ Count increases in one byte range of a file, chunk by chunk """
+
+    segment = empty(sizes)
+    for nums in read_range(filename, start, stop, chunk_size):
+        segment = merge(segment, summarize(nums, sizes), sizes)
+
+    return segment
+
+
+# --------------------------------------------------
+def test_count_range(tmp_path) -> None:
+    """ Test count_range """
+
+    filename = tmp_path / 'depths.txt'
+    filename.write_text('199\n200\n208\n210\n200\n207\n240\n269\n260\n263\n')
+
+    for chunk_size in [1, 5, 1024]:
+        segment = count_range(str(filename), 0, None, [1, 3, 9], chunk_size)
+        assert segment.increases.tolist() == [7, 5, 1]
+
+
+# --------------------------------------------------
+def empty(sizes: List[int]) -> Segment:
+    """ A segment with no measurements """
+
+    nothing = np.array([], dtype=np.int64)
+    return Segment(np.zeros(len(sizes), dtype=np.int64), nothing, nothing)
+
+
+# --------------------------------------------------
+def summarize(nums: np.ndarray, sizes: List[int]) -> Segment:
+    """ Count increases within a run and keep enough values at each end """
+
+    keep = max(sizes)
+    increases = np.array([n for _, n in sweep_windows(nums, sizes)],
+                         dtype=np.int64)
+
+    return Segment(increases, nums[:keep], nums[-keep:])
+
+
+# --------------------------------------------------
+def merge(left: Segment, right: Segment, sizes: List[int]) -> Segment:
+    """ Combine the counts of two adjacent runs of measurements """
+
+    keep = max(sizes)
+
+    # Add the windows that start in the left run and end in the right
+    crossing = [
+        cross_increases(left.tail, right.head, size) for size in sizes
+    ]
+
+    return Segment(left.increases + right.increases + crossing,
+                   np.concatenate([left.head, right.head])[:keep],
+                   np.concatenate([left.tail, right.tail])[-keep:])
+
+
+# --------------------------------------------------
+def cross_increases(tail: np.ndarray, head: np.ndarray, size: int) -> int:
+    """ Count increases comparing values in tail with values in head """
+
+    # Value tail[i] leaves as head[i + size - len(tail)] enters
+    lo = max(0, len(tail) - size)
+    offset = lo + size - len(tail)
+    num = min(len(tail) - lo, len(head) - offset)
+
+    if num <= 0:
+        return 0
+
+    return int(
+        np.count_nonzero(head[offset:offset + num] > tail[lo:lo + num]))
+
+
+# --------------------------------------------------
+def test_merge() -> None:
+    """ Test merge """
+
+    nums = np.array([199, 200, 208, 210, 200, 207, 240, 269, 260, 263])
+    sizes = [1, 2, 3, 4, 9, 10]
+    expected = [n for _, n in sweep_windows(nums, sizes)]
+
+    for i in range(len(nums) + 1):
+        for j in range(i, len(nums) + 1):
+            parts = [nums[:i], nums[i:j], nums[j:]]
+            total = reduce(partial(merge, sizes=sizes),
+                           [summarize(part, sizes) for part in parts],
+                           empty(sizes))
+            assert total.increases.tolist() == expected
+
+
 # --------------------------------------------------
 if __name__ == '__main__':
     main()
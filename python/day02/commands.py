@@ -0,0 +1,105 @@
+"""
+Author : Ken Youens-Clark <kyclark@gmail.com>
+Date   : 2021-12-02
+Purpose: Chunked course readers and decoder shared by both solutions
+"""
+
+import io
+import string
+import numpy as np
+from typing import BinaryIO, Iterator, Optional, Tuple
+
+BLANK_LETTERS = bytes.maketrans(string.ascii_letters.encode(),
+                                b' ' * len(string.ascii_letters))
+CHUNK_SIZE = 4 * 1024 * 1024
+
+
+# --------------------------------------------------
+def decode(data: bytes) -> Tuple[np.ndarray, np.ndarray]:
+    """ Decode a course into opcode and magnitude arrays """
+
+    # The opcode is the first letter of each word, found where a run of
+    # letters begins
+    buf = np.frombuffer(data, dtype=np.uint8)
+    letter = (buf | 0x20) - ord('a') < 26
+    starts = np.flatnonzero(letter[1:] > letter[:-1]) + 1
+    if letter[:1].any():
+        starts = np.r_[0, starts]
+    ops = buf[starts].view('S1')
+
+    # With the words blanked out, only the magnitudes are left to read
+    mags = np.fromstring(data.translate(BLANK_LETTERS),
+                         dtype=np.int64,
+                         sep=' ')
+    if len(ops) != len(mags):
+        raise ValueError(f'Found {len(ops)} commands but {len(mags)} numbers')
+
+    return ops, mags
+
+
+# --------------------------------------------------
+def test_decode() -> None:
+    """ Test decode """
+
+    ops, mags = decode(b'forward 5\ndown 5\n\n  forward 8\r\nup 3')
+    assert ops.tolist() == [b'f', b'd', b'f', b'u']
+    assert mags.tolist() == [5, 5, 8, 3]
+
+    ops, mags = decode(b'')
+    assert ops.tolist() == []
+    assert mags.tolist() == []
+
+
+# --------------------------------------------------
+def read_chunks(fh: BinaryIO,
+                chunk_size: int = CHUNK_SIZE,
+                limit: Optional[int] = None) -> Iterator[bytes]:
+    """ Read a file in chunks of whole lines, through the line at limit """
+
+    rest = b''
+    while limit is None or limit > 0:
+        data = fh.read(chunk_size if limit is None else min(chunk_size, limit))
+        if not data:
+            break
+        if limit is not None:
+            limit -= len(data)
+
+        data = rest + data
+        end = data.rfind(b'\n') + 1
+        yield data[:end]
+        rest = data[end:]
+
+    if limit == 0 and rest:
+        rest += fh.readline()
+
+    yield rest
+
+
+# --------------------------------------------------
+def read_course(fh: BinaryIO) -> Tuple[np.ndarray, np.ndarray]:
+    """ Decode a whole course file a chunk at a time """
+
+    ops, mags = zip(*map(decode, read_chunks(fh)))
+
+    return np.concatenate(ops), np.concatenate(mags)
+
+
+# --------------------------------------------------
+def test_read_chunks() -> None:
+    """ Test read_chunks and read_course """
+
+    text = b'forward 5\ndown 5\nforward 8\nup 3\ndown 8\nforward 2'
+    for chunk_size in [1, 4, 10, 100]:
+        chunks = list(read_chunks(io.BytesIO(text), chunk_size))
+        assert b''.join(chunks) == text
+        assert all(chunk.endswith(b'\n') for chunk in chunks[:-1] if chunk)
+
+    assert b''.join(read_chunks(io.BytesIO(text), 4, 17)) == text[:17]
+    assert b''.join(read_chunks(io.BytesIO(text), 4, 18)) == text[:27]
+
+    ops, mags = read_course(io.BytesIO(text))
+    assert ops.tolist() == [b'f', b'd', b'f', b'u', b'd', b'f']
+    assert mags.tolist() == [5, 5, 8, 3, 8, 2]
+
+    ops, mags = read_course(io.BytesIO(b''))
+    assert len(ops) == len(mags) == 0
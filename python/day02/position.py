@@ -7,12 +7,16 @@ Purpose: Rock the Casbah
 
 import argparse
 import sys
-from typing import NamedTuple, TextIO
+import numpy as np
+from typing import NamedTuple, Optional, TextIO
+from commands import decode, read_chunks, read_course
 
 
 class Args(NamedTuple):
     """ Command-line arguments """
     data: TextIO
+    batch: bool
+    outfile: Optional[str]
 
 
 # --------------------------------------------------
@@ -30,9 +34,20 @@ def get_args() -> Args:
                         type=argparse.FileType('rt'),
                         default=sys.stdin)
 
+    parser.add_argument('-b',
+                        '--batch',
+                        help='Decode the whole course with NumPy',
+                        action='store_true')
+
+    parser.add_argument('-o',
+                        '--outfile',
+                        help='Write the batch trajectory to a .npy file',
+                        metavar='FILE',
+                        type=str)
+
     args = parser.parse_args()
 
-    return Args(args.file)
+    return Args(args.file, args.batch or bool(args.outfile), args.outfile)
 
 
 # --------------------------------------------------
@@ -40,6 +55,23 @@ def main() -> None:
     """ Make a jazz noise here """
 
     args = get_args()
+
+    if args.outfile:
+        course = trajectory(*read_course(args.data.buffer))
+        np.save(args.outfile, course)
+        horz, depth = course[-1, :2].tolist() if len(course) else (0, 0)
+        print(f'horz {horz} * depth {depth} = {horz * depth}')
+        return
+
+    if args.batch:
+        horz, depth = 0, 0
+        for chunk in read_chunks(args.data.buffer):
+            ops, mags = decode(chunk)
+            horz += int(mags[ops == b'f'].sum())
+            depth += int(mags[ops == b'd'].sum() - mags[ops == b'u'].sum())
+        print(f'horz {horz} * depth {depth} = {horz * depth}')
+        return
+
     horz, depth = 0, 0
 
     for line in args.data:
@@ -55,7 +87,29 @@ def main() -> None:
 
     print(f'horz {horz} * depth {depth} = {horz * depth}')
 
-#
+
+# --------------------------------------------------
+def trajectory(ops: np.ndarray, mags: np.ndarray) -> np.ndarray:
+    """ Return the (horz, depth) position after each command """
+
+    horz = np.cumsum(np.where(ops == b'f', mags, 0))
+    depth = np.cumsum(
+        np.where(ops == b'd', mags, 0) - np.where(ops == b'u', mags, 0))
+
+    return np.column_stack([horz, depth])
+
+
+# --------------------------------------------------
+def test_trajectory() -> None:
+    """ Test trajectory """
+
+    ops, mags = decode(b'forward 5\ndown 5\nforward 8\n'
+                       b'up 3\ndown 8\nforward 2\n')
+    assert trajectory(ops, mags).tolist() == [[5, 0], [5, 5], [13, 5],
+                                              [13, 2], [13, 10], [15, 10]]
+    assert trajectory(*decode(b'')).shape == (0, 2)
+
+
 # --------------------------------------------------
 if __name__ == '__main__':
     main()
@@ -6,13 +6,40 @@ Purpose: Rock the Casbah
 """
 
 import argparse
+import json
+import os
 import sys
-from typing import NamedTuple, TextIO
+import time
+import numpy as np
+from functools import reduce
+from multiprocessing import Pool
+from typing import BinaryIO, NamedTuple, Optional, TextIO, Tuple
+from commands import CHUNK_SIZE, decode, read_chunks, read_course
 
 
 class Args(NamedTuple):
     """ Command-line arguments """
     data: TextIO
+    batch: bool
+    outfile: Optional[str]
+    jobs: int
+    follow: bool
+    checkpoint: Optional[str]
+    interval: float
+
+
+class Course(NamedTuple):
+    """ The change in aim, horz, and depth over a run of commands """
+    aim: int
+    horz: int
+    depth: int
+
+
+class Log(NamedTuple):
+    """ The file a checkpoint follows """
+    path: str
+    device: int
+    inode: int
 
 
 # --------------------------------------------------
@@ -30,9 +57,55 @@ def get_args() -> Args:
                         type=argparse.FileType('rt'),
                         default=sys.stdin)
 
+    parser.add_argument('-b',
+                        '--batch',
+                        help='Decode the whole course with NumPy',
+                        action='store_true')
+
+    parser.add_argument('-o',
+                        '--outfile',
+                        help='Write the batch trajectory to a .npy file',
+                        metavar='FILE',
+                        type=str)
+
+    parser.add_argument('-j',
+                        '--jobs',
+                        help='Number of processes for reducing the file',
+                        metavar='INT',
+                        type=int,
+                        default=1)
+
+    parser.add_argument('-F',
+                        '--follow',
+                        help='Keep reading commands appended to the file',
+                        action='store_true')
+
+    parser.add_argument('-c',
+                        '--checkpoint',
+                        help='Follow checkpoint file (default FILE.ckpt)',
+                        metavar='FILE',
+                        type=str)
+
+    parser.add_argument('-i',
+                        '--interval',
+                        help='Seconds to wait for new commands when following',
+                        metavar='FLOAT',
+                        type=float,
+                        default=1.)
+
     args = parser.parse_args()
 
-    return Args(args.file)
+    if args.jobs < 1:
+        parser.error(f'--jobs "{args.jobs}" must be > 0')
+
+    if (args.jobs > 1 or args.follow) and args.file is sys.stdin:
+        parser.error('--jobs and --follow require --file')
+
+    if args.follow and not args.checkpoint:
+        args.checkpoint = args.file.name + '.ckpt'
+
+    return Args(args.file, args.batch or bool(args.outfile), args.outfile,
+                args.jobs, args.follow, args.checkpoint, args.interval)
 
 
 # --------------------------------------------------
@@ -40,6 +113,32 @@ def main() -> None:
     """ Make a jazz noise here """
 
     args = get_args()
+
+    if args.follow:
+        follow(args.data.name, args.checkpoint, args.interval)
+        return
+
+    if args.jobs > 1:
+        course = reduce_parallel(args.data, args.jobs)
+        print(f'horz {course.horz} * depth {course.depth} = '
+              f'{course.horz * course.depth}')
+        return
+
+    if args.outfile:
+        course = trajectory(*read_course(args.data.buffer))
+        np.save(args.outfile, course)
+        horz, depth = course[-1, :2].tolist() if len(course) else (0, 0)
+        print(f'horz {horz} * depth {depth} = {horz * depth}')
+        return
+
+    if args.batch:
+        course = reduce(merge, (summarize(*decode(chunk))
+                                for chunk in read_chunks(args.data.buffer)),
+                        Course(0, 0, 0))
+        print(f'horz {course.horz} * depth {course.depth} = '
+              f'{course.horz * course.depth}')
+        return
+
     aim, horz, depth = 0, 0, 0
 
     for line in args.data:
@@ -57,6 +156,268 @@ def main() -> None:
     print(f'horz {horz} * depth {depth} = {horz * depth}')
 
 
+# --------------------------------------------------
+def trajectory(ops: np.ndarray, mags: np.ndarray) -> np.ndarray:
+    """ Return the (horz, depth, aim) position after each command """
+
+    forward = np.where(ops == b'f', mags, 0)
+    aim = np.cumsum(
+        np.where(ops == b'd', mags, 0) - np.where(ops == b'u', mags, 0))
+    horz = np.cumsum(forward)
+    depth = np.cumsum(aim * forward)
+
+    return np.column_stack([horz, depth, aim])
+
+
+# --------------------------------------------------
+def test_trajectory() -> None:
+    """ Test trajectory """
+
+    ops, mags = decode(b'forward 5\ndown 5\nforward 8\n'
+                       b'up 3\ndown 8\nforward 2\n')
+    assert trajectory(ops, mags).tolist() == [[5, 0, 0], [5, 0, 5],
+                                              [13, 40, 5], [13, 40, 2],
+                                              [13, 40, 10], [15, 60, 10]]
+    assert trajectory(*decode(b'')).shape == (0, 3)
+
+
+# --------------------------------------------------
+def summarize(ops: np.ndarray, mags: np.ndarray) -> Course:
+    """ Summarize a run of commands starting from zero """
+
+    if not len(ops):
+        return Course(0, 0, 0)
+
+    forward = np.where(ops == b'f', mags, 0)
+    aim = np.cumsum(
+        np.where(ops == b'd', mags, 0) - np.where(ops == b'u', mags, 0))
+
+    return Course(int(aim[-1]), int(forward.sum()),
+                  int((aim * forward).sum()))
+
+
+# --------------------------------------------------
+def merge(first: Course, second: Course) -> Course:
+    """ Combine two consecutive runs of commands """
+
+    # Every forward move in the second run also dives by the aim
+    # built up in the first
+    return Course(first.aim + second.aim, first.horz + second.horz,
+                  first.depth + second.depth + first.aim * second.horz)
+
+
+# --------------------------------------------------
+def test_merge() -> None:
+    """ Test merge """
+
+    text = b'forward 5\ndown 5\nforward 8\nup 3\ndown 8\nforward 2\n'
+    ops, mags = decode(text)
+
+    assert summarize(ops, mags) == Course(10, 15, 60)
+    assert summarize(*decode(b'')) == Course(0, 0, 0)
+
+    for i in range(len(ops) + 1):
+        assert merge(summarize(ops[:i], mags[:i]),
+                     summarize(ops[i:], mags[i:])) == Course(10, 15, 60)
+
+    steps = [summarize(ops[i:i + 1], mags[i:i + 1]) for i in range(len(ops))]
+    assert reduce(merge, steps, Course(0, 0, 0)) == Course(10, 15, 60)
+
+
+# --------------------------------------------------
+def reduce_parallel(fh: TextIO, jobs: int) -> Course:
+    """ Summarize chunks of the file in a pool of processes """
+
+    size = os.fstat(fh.fileno()).st_size
+
+    with Pool(jobs) as pool:
+        courses = pool.starmap(summarize_range,
+                               [(fh.name, i * size // jobs,
+                                 (i + 1) * size // jobs) for i in range(jobs)])
+
+    return reduce(merge, courses, Course(0, 0, 0))
+
+
+# --------------------------------------------------
+def summarize_range(filename: str, start: int, stop: int) -> Course:
+    """ Summarize the commands on lines beginning in a byte range """
+
+    with open(filename, 'rb') as fh:
+        # Skip the rest of a line begun before the range
+        if start:
+            fh.seek(start - 1)
+            fh.readline()
+
+        begin = fh.tell()
+        if begin >= stop:
+            return Course(0, 0, 0)
+
+        chunks = read_chunks(fh, limit=stop - begin)
+        return reduce(merge, (summarize(*decode(chunk)) for chunk in chunks),
+                      Course(0, 0, 0))
+
+
+# --------------------------------------------------
+def test_summarize_range(tmp_path) -> None:
+    """ Test summarize_range """
+
+    filename = tmp_path / 'course.txt'
+    filename.write_bytes(
+        b'forward 5\ndown 5\nforward 8\nup 3\ndown 8\nforward 2\n')
+    size = filename.stat().st_size
+
+    for num in range(1, size + 2):
+        courses = [
+            summarize_range(str(filename), i * size // num,
+                            (i + 1) * size // num) for i in range(num)
+        ]
+        assert reduce(merge, courses, Course(0, 0, 0)) == Course(10, 15, 60)
+
+
+# --------------------------------------------------
+def follow(filename: str, checkpoint: str, interval: float) -> None:
+    """ Fold in commands as they are appended, saving a checkpoint """
+
+    course, offset, log = load_checkpoint(checkpoint)
+
+    try:
+        # Each pass follows the file until it is truncated or replaced
+        while True:
+            with open(filename, 'rb') as fh:
+                current = log_id(filename, fh)
+                problem = check_log(log, offset, current,
+                                    os.fstat(fh.fileno()).st_size)
+                if problem:
+                    print(f'{problem}, starting over', file=sys.stderr)
+                    course, offset = Course(0, 0, 0), 0
+                log = current
+
+                fh.seek(offset)
+                buffer = b''
+                while True:
+                    data = fh.read(CHUNK_SIZE)
+                    if not data:
+                        if replaced(filename, fh, offset + len(buffer)):
+                            break
+                        time.sleep(interval)
+                        continue
+
+                    # Hold back a partial line until the writer finishes it
+                    buffer += data
+                    end = buffer.rfind(b'\n') + 1
+                    if not end:
+                        continue
+
+                    lines, buffer = buffer[:end], buffer[end:]
+                    course = merge(course, summarize(*decode(lines)))
+                    offset += end
+                    save_checkpoint(checkpoint, course, offset, log)
+                    print(f'horz {course.horz} * depth {course.depth} = '
+                          f'{course.horz * course.depth}', flush=True)
+    except KeyboardInterrupt:
+        pass
+
+
+# --------------------------------------------------
+def log_id(filename: str, fh: BinaryIO) -> Log:
+    """ Identify the open file by its path, device, and inode """
+
+    stat = os.fstat(fh.fileno())
+    return Log(os.path.abspath(filename), stat.st_dev, stat.st_ino)
+
+
+# --------------------------------------------------
+def check_log(saved: Optional[Log], offset: int, current: Log,
+              size: int) -> Optional[str]:
+    """ Explain why a checkpoint can't resume the file, if it can't """
+
+    if saved is None:
+        return 'Checkpoint has no log' if offset else None
+    if saved.path != current.path:
+        return f'Checkpoint is for "{saved.path}"'
+    if saved != current:
+        return f'"{current.path}" was replaced'
+    if offset > size:
+        return f'"{current.path}" was truncated'
+
+    return None
+
+
+# --------------------------------------------------
+def test_check_log() -> None:
+    """ Test check_log """
+
+    log = Log('/logs/course.txt', 1, 100)
+
+    assert check_log(None, 0, log, 0) is None
+    assert check_log(log, 50, log, 80) is None
+    assert check_log(log, 50, log, 20) == '"/logs/course.txt" was truncated'
+    assert check_log(log, 50, log._replace(inode=101),
+                     80) == '"/logs/course.txt" was replaced'
+    assert check_log(log._replace(path='/logs/other.txt'), 50, log,
+                     80) == 'Checkpoint is for "/logs/other.txt"'
+    assert check_log(None, 50, log, 80) == 'Checkpoint has no log'
+
+
+# --------------------------------------------------
+def replaced(filename: str, fh: BinaryIO, offset: int) -> bool:
+    """ Check if the path now names another file or the file shrank """
+
+    try:
+        stat = os.stat(filename)
+    except FileNotFoundError:
+        # Wait for the writer to create the new file
+        return False
+
+    opened = os.fstat(fh.fileno())
+    return (stat.st_dev, stat.st_ino) != (opened.st_dev, opened.st_ino) or \
+        opened.st_size < offset
+
+
+# --------------------------------------------------
+def load_checkpoint(filename: str) -> Tuple[Course, int, Optional[Log]]:
+    """ Load the running course, file offset, and log, if saved """
+
+    if not os.path.isfile(filename):
+        return Course(0, 0, 0), 0, None
+
+    with open(filename, 'rt') as fh:
+        saved = json.load(fh)
+
+    log = Log(**saved['log']) if saved.get('log') else None
+    return Course(**saved['course']), saved['offset'], log
+
+
+# --------------------------------------------------
+def save_checkpoint(filename: str, course: Course, offset: int,
+                    log: Log) -> None:
+    """ Save the running course, file offset, and log """
+
+    # Write a new file and swap it in so a crash never leaves half a file
+    tmp = filename + '.tmp'
+    with open(tmp, 'wt') as fh:
+        json.dump(
+            {
+                'course': course._asdict(),
+                'offset': offset,
+                'log': log._asdict()
+            }, fh)
+    os.replace(tmp, filename)
+
+
+# --------------------------------------------------
+def test_checkpoint(tmp_path) -> None:
+    """ Test load_checkpoint and save_checkpoint """
+
+    filename = str(tmp_path / 'course.ckpt')
+    log = Log('/logs/course.txt', 1, 100)
+
+    assert load_checkpoint(filename) == (Course(0, 0, 0), 0, None)
+
+    save_checkpoint(filename, Course(10, 15, 60), 42, log)
+    assert load_checkpoint(filename) == (Course(10, 15, 60), 42, log)
+
+
 # --------------------------------------------------
 if __name__ == '__main__':
     main()
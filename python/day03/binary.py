@@ -6,12 +6,14 @@ Purpose: Rock the Casbah
 """
 
 import argparse
-from typing import NamedTuple, TextIO
+import numpy as np
+from typing import NamedTuple, Optional, TextIO, Tuple
 
 
 class Args(NamedTuple):
     """ Command-line arguments """
     file: TextIO
+    packed: bool
 
 
 # --------------------------------------------------
@@ -27,9 +29,14 @@ def get_args() -> Args:
                         metavar='FILE',
                         type=argparse.FileType('rt'))
 
+    parser.add_argument('-p',
+                        '--packed',
+                        help='Pack rows into 64-bit words',
+                        action='store_true')
+
     args = parser.parse_args()
 
-    return Args(args.file)
+    return Args(args.file, args.packed)
 
 
 # --------------------------------------------------
@@ -37,15 +44,22 @@ def main() -> None:
     """ Make a jazz noise here """
 
     args = get_args()
-    nums = [list(map(int, list(v.rstrip()))) for v in args.file]
     epsilon, gamma = '', ''
 
-    for i in range(len(nums[0])):
-        bits = [n[i] for n in nums]
-        ones = len(list(filter(lambda b: b, bits)))
-        zeros = len(bits) - ones
-        epsilon += '1' if ones > zeros else '0'
-        gamma += '0' if ones > zeros else '1'
+    if args.packed:
+        words, width = read_packed(args.file)
+        for ones in count_ones(words, width):
+            zeros = len(words) - ones
+            epsilon += '1' if ones > zeros else '0'
+            gamma += '0' if ones > zeros else '1'
+    else:
+        nums = [list(map(int, list(v.rstrip()))) for v in args.file]
+        for i in range(len(nums[0])):
+            bits = [n[i] for n in nums]
+            ones = len(list(filter(lambda b: b, bits)))
+            zeros = len(bits) - ones
+            epsilon += '1' if ones > zeros else '0'
+            gamma += '0' if ones > zeros else '1'
 
     epsilon_bin = int(epsilon, base=2)
     gamma_bin = int(gamma, base=2)
@@ -53,6 +67,109 @@ def main() -> None:
           f'{epsilon_bin * gamma_bin}')
 
 
+# --------------------------------------------------
+def read_packed(fh: TextIO,
+                chunk_rows: int = 1 << 20) -> Tuple[np.ndarray, int]:
+    """ Read rows of bits into packed words, a chunk of rows at a time """
+
+    raw = fh.buffer
+    line = raw.readline()
+    first = line.rstrip(b'\r\n')
+    width = len(first)
+
+    # Every row ends like the first, whether with "\n" or "\r\n"
+    eol = line[width:] or b'\n'
+    stride = width + len(eol)
+    chunks = [pack_rows(first + eol, width, stride)]
+
+    while chunk := raw.read(chunk_rows * stride):
+        if len(chunk) % stride >= width:
+            chunk += eol[len(chunk) % stride - width:]
+        chunks.append(pack_rows(chunk, width, stride))
+
+    return np.concatenate(chunks), width
+
+
+# --------------------------------------------------
+def pack_rows(buf: bytes,
+              width: int,
+              stride: Optional[int] = None) -> np.ndarray:
+    """ Pack newline-terminated rows of bits into uint64 words """
+
+    # Columns run from the high bit of the first word, padded to 64 bits
+    num_words = -(-width // 64)
+    text = np.frombuffer(buf, dtype=np.uint8).reshape(-1, stride or width + 1)
+    bits = np.zeros((len(text), num_words * 64), dtype=np.uint8)
+    bits[:, :width] = text[:, :width] == ord('1')
+
+    return np.packbits(bits, axis=1).view('>u8').astype(np.uint64)
+
+
+# --------------------------------------------------
+def test_pack_rows() -> None:
+    """ Test pack_rows """
+
+    assert pack_rows(b'10110\n00001\n', 5).tolist() == [[22 << 59],
+                                                        [1 << 59]]
+
+    wide = ('1' + '0' * 63 + '11').encode() + b'\n'
+    assert pack_rows(wide, 66).tolist() == [[1 << 63, 3 << 62]]
+    assert pack_rows(b'10110\r\n00001\r\n', 5, 7).tolist() == [[22 << 59],
+                                                             [1 << 59]]
+
+
+# --------------------------------------------------
+def test_read_packed(tmp_path) -> None:
+    """ Test read_packed """
+
+    filename = tmp_path / 'bits.txt'
+    for eol in ['\n', '\r\n']:
+        for end in ['', eol]:
+            filename.write_bytes(eol.join(['10110', '00001', '11100']).encode()
+                                 + end.encode())
+            for chunk_rows in [1, 2, 100]:
+                with open(filename) as fh:
+                    words, width = read_packed(fh, chunk_rows)
+                assert width == 5
+                assert words.tolist() == [[22 << 59], [1 << 59], [28 << 59]]
+
+
+# --------------------------------------------------
+def count_ones(words: np.ndarray,
+               width: int,
+               block_rows: int = 1 << 20) -> np.ndarray:
+    """ Count the ones in each column of packed rows """
+
+    counts = np.zeros(width, dtype=np.int64)
+    one = np.uint64(1)
+
+    for start in range(0, len(words), block_rows):
+        block = words[start:start + block_rows]
+        for col in range(width):
+            word, bit = divmod(col, 64)
+            shifted = block[:, word] >> np.uint64(63 - bit)
+            counts[col] += np.count_nonzero(shifted & one)
+
+    return counts
+
+
+# --------------------------------------------------
+def test_count_ones() -> None:
+    """ Test count_ones """
+
+    rows = [
+        '00100', '11110', '10110', '10111', '10101', '01111', '00111',
+        '11100', '10000', '11001', '00010', '01010'
+    ]
+    words = pack_rows(''.join(r + '\n' for r in rows).encode(), 5)
+
+    assert count_ones(words, 5).tolist() == [7, 5, 8, 7, 5]
+    assert count_ones(words, 5, block_rows=5).tolist() == [7, 5, 8, 7, 5]
+
+    wide = pack_rows(b'1' * 130 + b'\n' + b'0' * 129 + b'1\n', 130)
+    assert count_ones(wide, 130).tolist() == [1] * 129 + [2]
+
+
 # --------------------------------------------------
 if __name__ == '__main__':
     main()
@@ -6,13 +6,28 @@ Purpose: Rock the Casbah
 """
 
 import argparse
+import os
+import numpy as np
+from bisect import bisect_left
 from pprint import pprint
-from typing import List, NamedTuple, TextIO, Optional
+from typing import List, NamedTuple, TextIO, Optional, Tuple
 
 
 class Args(NamedTuple):
     """ Command-line arguments """
     file: TextIO
+    bisect: bool
+    index: Optional[str]
+    tie: Optional[str]
+    stop: int
+
+
+class Index(NamedTuple):
+    """ A binary trie of rows stored as arrays """
+    children: np.ndarray
+    counts: np.ndarray
+    width: int
+    source: str = ''
 
 
 # --------------------------------------------------
@@ -28,9 +43,40 @@ def get_args() -> Args:
                         metavar='FILE',
                         type=argparse.FileType('rt'))
 
+    parser.add_argument('-b',
+                        '--bisect',
+                        help='Narrow a sorted array with binary search',
+                        action='store_true')
+
+    parser.add_argument('-i',
+                        '--index',
+                        help='Trie index file, built from FILE if missing',
+                        metavar='INDEX',
+                        type=str)
+
+    parser.add_argument('-t',
+                        '--tie',
+                        help='Bit to keep on a tie (default 1 for oxygen, '
+                        '0 for CO2)',
+                        metavar='BIT',
+                        choices=['0', '1'])
+
+    parser.add_argument('-s',
+                        '--stop',
+                        help='Stop when this many rows remain',
+                        metavar='INT',
+                        type=int,
+                        default=1)
+
     args = parser.parse_args()
 
-    return Args(args.file)
+    if (args.tie or args.stop != 1) and not args.index:
+        parser.error('--tie and --stop require --index')
+
+    if args.stop < 1:
+        parser.error(f'--stop "{args.stop}" must be > 0')
+
+    return Args(args.file, args.bisect, args.index, args.tie, args.stop)
 
 
 # --------------------------------------------------
@@ -38,12 +84,29 @@ def main() -> None:
     """ Make a jazz noise here """
 
     args = get_args()
-    nums = [list(v.rstrip()) for v in args.file]
-    oxygen = calc(nums, True)
+
+    if args.index:
+        index = get_index(args.file, args.index)
+        oxygen, oxygen_count = query(index, True, args.tie, args.stop)
+        co2, co2_count = query(index, False, args.tie, args.stop)
+        if oxygen_count != 1 or co2_count != 1:
+            print(f'oxygen {oxygen} matches {oxygen_count}')
+            print(f'co2 {co2} matches {co2_count}')
+            return
+    elif args.bisect:
+        lines = list(map(str.rstrip, args.file))
+        width = len(lines[0])
+        rows = sorted(int(line, base=2) for line in lines)
+        oxygen = calc_sorted(rows, width, True)
+        co2 = calc_sorted(rows, width, False)
+    else:
+        nums = [list(v.rstrip()) for v in args.file]
+        oxygen = calc(nums, True)
+        co2 = calc(nums, False)
+
     oxygen_val = int(oxygen, base=2)
     print(f'oxygen {oxygen} oxygen_val {oxygen_val}')
 
-    co2 = calc(nums, False)
     co2_val = int(co2, base=2)
     print(f'co2 {co2} co2_val {co2_val}')
 
@@ -67,6 +130,202 @@ def calc(vals: List[List[str]], most_wanted: bool) -> Optional[str]:
             return ''.join(copied[0])
 
 
+# --------------------------------------------------
+def calc_sorted(rows: List[int], width: int,
+                most_wanted: bool) -> Optional[str]:
+    """ Calculate by narrowing a range of sorted rows """
+
+    lo, hi = 0, len(rows)
+    prefix = 0
+    for i in range(width):
+        # Rows in range share the bits before i, so those with a 1 at i
+        # sort after those with a 0
+        bit = 1 << (width - 1 - i)
+        mid = bisect_left(rows, prefix | bit, lo, hi)
+        ones, zeros = hi - mid, mid - lo
+        keep_ones = (ones >= zeros) == most_wanted
+        lo, hi = (mid, hi) if keep_ones else (lo, mid)
+        prefix |= bit if keep_ones else 0
+
+        if hi - lo == 1:
+            return f'{rows[lo]:0{width}b}'
+
+    return None
+
+
+# --------------------------------------------------
+def test_calc_sorted() -> None:
+    """ Test calc_sorted """
+
+    lines = [
+        '00100', '11110', '10110', '10111', '10101', '01111', '00111',
+        '11100', '10000', '11001', '00010', '01010'
+    ]
+    rows = sorted(int(line, base=2) for line in lines)
+
+    assert calc_sorted(rows, 5, True) == '10111'
+    assert calc_sorted(rows, 5, False) == '01010'
+    assert calc_sorted(rows, 5, True) == calc(list(map(list, lines)), True)
+    assert calc_sorted(rows, 5, False) == calc(list(map(list, lines)), False)
+
+
+# --------------------------------------------------
+def get_index(fh: TextIO, filename: str) -> Index:
+    """ Load the index, building it first if missing or stale """
+
+    source = source_id(fh.name)
+    if os.path.isfile(filename):
+        index = load_index(filename)
+        if index.source == source:
+            return index
+
+    lines = list(map(str.rstrip, fh))
+    index = build_index([int(line, base=2) for line in lines],
+                        len(lines[0]))._replace(source=source)
+    save_index(index, filename)
+
+    return index
+
+
+# --------------------------------------------------
+def source_id(filename: str) -> str:
+    """ Identify a report by its path, size, and modification time """
+
+    stat = os.stat(filename)
+    return f'{os.path.abspath(filename)}:{stat.st_size}:{stat.st_mtime_ns}'
+
+
+# --------------------------------------------------
+def test_get_index(tmp_path) -> None:
+    """ Test get_index """
+
+    report, other = tmp_path / 'report.txt', tmp_path / 'other.txt'
+    report.write_text('00100\n11110\n10110\n')
+    other.write_text('1\n')
+    filename = str(tmp_path / 'report.idx')
+
+    with open(report) as fh:
+        assert get_index(fh, filename).counts[0] == 3
+    with open(report) as fh:
+        assert get_index(fh, filename).source == source_id(str(report))
+
+    # An index of one report is never reused for another
+    with open(other) as fh:
+        index = get_index(fh, filename)
+        assert (index.width, index.counts[0]) == (1, 1)
+
+
+# --------------------------------------------------
+def build_index(rows: List[int], width: int) -> Index:
+    """ Build a trie with a count of the rows under each node """
+
+    if width > 64:
+        raise ValueError(f'Cannot index rows wider than 64 bits ({width})')
+
+    rows = np.sort(np.array(rows, dtype=np.uint64))
+    levels = [(np.zeros(1, dtype=np.uint64), np.array([len(rows)]))]
+    for depth in range(1, width + 1):
+        levels.append(
+            np.unique(rows >> np.uint64(width - depth), return_counts=True))
+
+    # Nodes are numbered level by level, each level in prefix order
+    offsets = np.cumsum([0] + [len(prefixes) for prefixes, _ in levels])
+    dtype = np.int32 if offsets[-1] < 2**31 else np.int64
+    children = np.full((offsets[-1], 2), -1, dtype=dtype)
+
+    for depth in range(1, width + 1):
+        parent_prefixes, prefixes = levels[depth - 1][0], levels[depth][0]
+        parents = offsets[depth - 1] + np.searchsorted(
+            parent_prefixes, prefixes >> np.uint64(1))
+        children[parents, (prefixes & np.uint64(1)).astype(np.intp)] = \
+            offsets[depth] + np.arange(len(prefixes))
+
+    counts = np.concatenate([counts for _, counts in levels])
+    return Index(children, counts.astype(np.int64), width)
+
+
+# --------------------------------------------------
+def save_index(index: Index, filename: str) -> None:
+    """ Save an index to disk """
+
+    with open(filename, 'wb') as fh:
+        np.savez(fh,
+                 children=index.children,
+                 counts=index.counts,
+                 width=np.array(index.width),
+                 source=np.array(index.source))
+
+
+# --------------------------------------------------
+def load_index(filename: str) -> Index:
+    """ Load an index from disk """
+
+    with np.load(filename) as data:
+        source = str(data['source']) if 'source' in data else ''
+        return Index(data['children'], data['counts'], int(data['width']),
+                     source)
+
+
+# --------------------------------------------------
+def query(index: Index,
+          most_wanted: bool,
+          tie: Optional[str] = None,
+          stop: int = 1) -> Tuple[str, int]:
+    """ Walk the trie, returning the prefix reached and its row count """
+
+    tie = tie or ('1' if most_wanted else '0')
+    node, bits = 0, ''
+
+    while len(bits) < index.width and index.counts[node] > stop:
+        zero, one = index.children[node]
+        zeros = index.counts[zero] if zero >= 0 else 0
+        ones = index.counts[one] if one >= 0 else 0
+
+        if zeros == ones:
+            bit = tie
+        elif (ones > zeros) == most_wanted:
+            bit = '1'
+        else:
+            bit = '0'
+
+        # Never follow a bit that no row has
+        if (zeros if bit == '0' else ones) == 0:
+            bit = '1' if bit == '0' else '0'
+
+        node = zero if bit == '0' else one
+        bits += bit
+
+    # A single row left has just one path down to its leaf
+    while len(bits) < index.width and index.counts[node] == 1:
+        zero, one = index.children[node]
+        node, bits = (zero, bits + '0') if zero >= 0 else (one, bits + '1')
+
+    return bits, int(index.counts[node])
+
+
+# --------------------------------------------------
+def test_query(tmp_path) -> None:
+    """ Test build_index and query """
+
+    lines = [
+        '00100', '11110', '10110', '10111', '10101', '01111', '00111',
+        '11100', '10000', '11001', '00010', '01010'
+    ]
+    index = build_index([int(line, base=2) for line in lines], 5)
+
+    assert query(index, True) == ('10111', 1)
+    assert query(index, False) == ('01010', 1)
+    assert query(index, True, stop=3) == ('101', 3)
+    assert query(index, False, stop=5) == ('0', 5)
+    assert query(index, True, tie='0') == ('10110', 1)
+
+    filename = str(tmp_path / 'report.idx')
+    save_index(index, filename)
+    loaded = load_index(filename)
+    assert loaded.width == 5
+    assert query(loaded, True) == ('10111', 1)
+
+
 # --------------------------------------------------
 if __name__ == '__main__':
     main()
@@ -7,13 +7,25 @@ Purpose: Rock the Casbah
 
 import argparse
 import sys
+import numpy as np
+from itertools import chain, groupby, islice
+from multiprocessing import Pool
 from pprint import pprint
-from typing import NamedTuple, TextIO
+from typing import (Iterable, Iterator, List, NamedTuple, Optional, TextIO,
+                    Tuple)
+
+PATTERNS = ['rows', 'cols', 'diagonals', 'corners', 'blackout']
 
 
 class Args(NamedTuple):
     """ Command-line arguments """
     file: TextIO
+    rank: bool
+    kth: List[int]
+    jobs: int
+    patterns: List[str]
+    pattern_file: Optional[TextIO]
+    batch_size: int
 
 
 # --------------------------------------------------
@@ -31,9 +43,65 @@ def get_args() -> Args:
                         type=argparse.FileType('rt'),
                         default=sys.stdin)
 
+    parser.add_argument('-r',
+                        '--rank',
+                        help='Compute win turns from draw ranks',
+                        action='store_true')
+
+    parser.add_argument('-k',
+                        '--kth',
+                        help='Winners to show with --rank (1 first, -1 last)',
+                        metavar='INT',
+                        type=int,
+                        nargs='+',
+                        default=[1, -1])
+
+    parser.add_argument('-j',
+                        '--jobs',
+                        help='Number of processes for --rank',
+                        metavar='INT',
+                        type=int,
+                        default=1)
+
+    parser.add_argument('-p',
+                        '--patterns',
+                        help='Comma-separated winning patterns from ' +
+                        ', '.join(PATTERNS),
+                        metavar='STR',
+                        type=str,
+                        default='rows,cols')
+
+    parser.add_argument('-P',
+                        '--pattern-file',
+                        help='More winning patterns as grids of '
+                        '"#" (in) and "." (out)',
+                        metavar='FILE',
+                        type=argparse.FileType('rt'))
+
+    parser.add_argument('-b',
+                        '--batch-size',
+                        help='Number of boards to load at a time',
+                        metavar='INT',
+                        type=int,
+                        default=100000)
+
     args = parser.parse_args()
 
-    return Args(args.file)
+    patterns = [name.strip() for name in args.patterns.split(',')]
+    if bad := [name for name in patterns if name not in PATTERNS]:
+        parser.error(f'Invalid --patterns "{", ".join(bad)}"')
+
+    if 0 in args.kth:
+        parser.error('--kth values cannot be 0')
+
+    if args.jobs < 1:
+        parser.error(f'--jobs "{args.jobs}" must be > 0')
+
+    if args.batch_size < 1:
+        parser.error(f'--batch-size "{args.batch_size}" must be > 0')
+
+    return Args(args.file, args.rank, args.kth, args.jobs, patterns,
+                args.pattern_file, args.batch_size)
 
 
 # --------------------------------------------------
@@ -41,74 +109,348 @@ def main() -> None:
     """ Make a jazz noise here """
 
     args = get_args()
-    nums = args.file.readline().rstrip().split(',')
-    boards, buffer = [], []
+    nums = list(map(int, args.file.readline().rstrip().split(',')))
 
-    for line in map(str.rstrip, args.file):
-        if line == '':
-            if buffer:
-                boards.append(buffer[:])
-                buffer = []
+    # The first row of the first board gives the board size
+    first = next((line for line in args.file if line.strip()), '')
+    if not first:
+        sys.exit(f'No boards in "{args.file.name}"')
 
-        buffer.extend(line.split())
+    size = len(first.split())
+    area = size * size
+    batches = iter_boards(chain([first], args.file), size, args.batch_size)
 
-    if buffer:
-        boards.append(buffer[:])
+    patterns = make_patterns(size, args.patterns)
+    if args.pattern_file:
+        try:
+            patterns.extend(parse_patterns(args.pattern_file.read(), size))
+        except ValueError as err:
+            sys.exit(f'Invalid --pattern-file: {err}')
 
+    if args.rank:
+        show_ranked(np.array(nums, dtype=np.int64), batches, patterns,
+                    args.kth, args.jobs)
+        return
+
+    boards = np.concatenate([np.empty((0, area), dtype=np.int32)] +
+                            list(batches))
+
+    for i, total, num in play(boards, nums, patterns):
+        print(f'Winner {i} = {total} * {num} = {total * num}')
+
+
+# --------------------------------------------------
+def play(boards: np.ndarray, nums: List[int],
+         patterns: List[int]) -> Iterator[Tuple[int, int, int]]:
+    """ Yield each board as it wins, its unmarked sum, and the draw """
+
+    area = boards.shape[1]
+
+    # The patterns through each position, so a mark checks only those
+    cell_wins = [[mask for mask in patterns if mask >> pos & 1]
+                 for pos in range(area)]
+    values, cells = build_index(boards)
+    marked = [0] * len(boards)
+    unmarked = boards.sum(axis=1).tolist()
     won = set()
     for num in nums:
-        for i, board in enumerate(boards):
-            if positions := [i for i, n in enumerate(board) if n == num]:
-                for pos in positions:
-                    boards[i][pos] = 'X'
+        # Only visit the boards that have this number
+        lo, hi = np.searchsorted(values, [num, num + 1])
+        for i, group in groupby(cells[lo:hi].tolist(),
+                                key=lambda cell: cell // area):
+            # A number drawn again marks nothing new
+            positions = [
+                cell % area for cell in group
+                if not marked[i] >> (cell % area) & 1
+            ]
+            for pos in positions:
+                marked[i] |= 1 << pos
+                unmarked[i] -= num
 
-                if find_winner(board):
-                    total = sum([int(n) for n in board if n != 'X'])
-                    print(f'Winner {i} = {total} * {num} = {total * int(num)}')
-                    won.add(i)
+            if i not in won and any(
+                    is_winner(marked[i], cell_wins[pos])
+                    for pos in positions):
+                yield i, unmarked[i], num
+                won.add(i)
 
-            if len(won) == len(boards):
-                sys.exit()
+                if len(won) == len(boards):
+                    return
 
 
 # --------------------------------------------------
-def find_winner(board):
-    """ Return the winner """
+def test_play() -> None:
+    """ Test play """
+
+    boards = np.array([list(range(1, 10)), [9, 8, 7, 1, 2, 3, 4, 5, 6]])
+    patterns = make_patterns(3, ['rows', 'cols'])
 
-    winning = [[0, 1, 2, 3, 4], [5, 6, 7, 8, 9], [10, 11, 12, 13, 14],
-               [15, 16, 17, 18, 19], [20, 21, 22, 23, 24], [0, 5, 10, 15, 20],
-               [1, 6, 11, 16, 21], [2, 7, 12, 17, 22], [3, 8, 13, 18, 23],
-               [4, 9, 14, 19, 24]]
+    # Drawing 1 twice must not take it off the unmarked sum twice
+    draws = [1, 1, 2, 1, 3]
+    assert list(play(boards, draws, patterns)) == [(0, 39, 3), (1, 39, 3)]
 
-    for combo in winning:
-        group = list(map(lambda i: board[i], combo))
-        if all([spot == 'X' for spot in group]):
-            return True
+    rng = np.random.default_rng(4)
+    for _ in range(20):
+        boards = rng.permutation(np.arange(30))[:18].reshape(2, 9)
+        draws = rng.integers(0, 30, 40)
+        turns, unmarked = rank_boards(boards, draws, patterns)
+        expected = sorted((turn, i, total, draws[turn])
+                          for i, (turn, total) in enumerate(
+                              zip(turns.tolist(), unmarked.tolist()))
+                          if turn < len(draws))
+        assert list(play(boards, draws.tolist(), patterns)) == [
+            (i, total, num) for _, i, total, num in expected
+        ]
 
 
 # --------------------------------------------------
-def test_find_winner() -> None:
-    """ Test find_winner """
+def make_patterns(size: int, names: List[str]) -> List[int]:
+    """ Make winning patterns as bitmasks of board positions """
 
-    board1 = [
-        '31', '93', '46', '11', '30', '2', '45', '40', '69', '33', '82', '21',
-        '37', '99', '86', '57', '16', '34', '94', '85', '60', '49', '28', '14',
-        '65'
-    ]
-    assert not find_winner(board1)
+    def mask(cells) -> int:
+        return sum(1 << (row * size + col) for row, col in cells)
 
-    board2 = [
-        'X', 'X', 'X', 'X', 'X', '2', '45', '40', '69', '33', '82', '21', '37',
-        '99', '86', '57', '16', '34', '94', '85', '60', '49', '28', '14', '65'
-    ]
-    assert find_winner(board2)
+    last = size - 1
+    patterns = []
+    for name in names:
+        if name == 'rows':
+            patterns.extend(
+                mask((row, col) for col in range(size))
+                for row in range(size))
+        elif name == 'cols':
+            patterns.extend(
+                mask((row, col) for row in range(size))
+                for col in range(size))
+        elif name == 'diagonals':
+            patterns.append(mask((i, i) for i in range(size)))
+            patterns.append(mask((i, last - i) for i in range(size)))
+        elif name == 'corners':
+            patterns.append(mask([(0, 0), (0, last), (last, 0),
+                                  (last, last)]))
+        elif name == 'blackout':
+            patterns.append((1 << (size * size)) - 1)
+
+    return patterns
+
+
+# --------------------------------------------------
+def test_make_patterns() -> None:
+    """ Test make_patterns """
+
+    assert make_patterns(3, ['rows']) == [0b111, 0b111000, 0b111000000]
+    assert make_patterns(3, ['cols']) == [0b1001001, 0b10010010, 0b100100100]
+    assert make_patterns(3, ['diagonals']) == [0b100010001, 0b1010100]
+    assert make_patterns(3, ['corners']) == [0b101000101]
+    assert make_patterns(3, ['blackout']) == [0b111111111]
+    assert len(make_patterns(9, ['rows', 'cols'])) == 18
+
+
+# --------------------------------------------------
+def parse_patterns(text: str, size: int) -> List[int]:
+    """ Parse grids of "#" (in) and "." (out) separated by blank lines """
+
+    patterns = []
+    for grid in text.strip().split('\n\n'):
+        rows = grid.split()
+        if len(rows) != size or any(len(row) != size for row in rows):
+            raise ValueError(f'Pattern must be {size}x{size}: "{grid}"')
+        if set(''.join(rows)) - set('#.'):
+            raise ValueError(f'Pattern must be only "#" and ".": "{grid}"')
+        if '#' not in grid:
+            raise ValueError(f'Pattern must have a "#": "{grid}"')
+        patterns.append(
+            sum(1 << pos for pos, cell in enumerate(''.join(rows))
+                if cell == '#'))
+
+    return patterns
+
+
+# --------------------------------------------------
+def test_parse_patterns() -> None:
+    """ Test parse_patterns """
+
+    assert parse_patterns('#..\n.#.\n..#\n', 3) == [0b100010001]
+    assert parse_patterns('##\n..\n\n.#\n.#', 2) == [0b11, 0b1010]
+
+    for text in ['#.\n..\n\n..\n..', '#.\nx.', '#.#\n...']:
+        try:
+            parse_patterns(text, 2)
+            assert False
+        except ValueError:
+            pass
+
+
+# --------------------------------------------------
+def is_winner(marked: int, patterns: List[int]) -> bool:
+    """ Check if the marked positions complete any pattern """
+
+    return any(marked & mask == mask for mask in patterns)
+
+
+# --------------------------------------------------
+def test_is_winner() -> None:
+    """ Test is_winner """
+
+    row = 0b11111
+    col = sum(1 << pos for pos in [2, 7, 12, 17, 22])
+    patterns = make_patterns(5, ['rows', 'cols'])
 
-    board3 = [
-        'X', '93', '46', '11', '30', 'X', '45', '40', '69', '33', 'X', '21',
-        '37', '99', '86', 'X', '16', '34', '94', '85', 'X', '49', '28', '14',
-        '65'
+    assert is_winner(row, patterns)
+    assert is_winner(col, patterns)
+    assert not is_winner(col ^ (1 << 22), patterns)
+    assert not is_winner(0b11110, patterns)
+    assert is_winner(0b11110, [0b110])
+
+
+# --------------------------------------------------
+def show_ranked(draws: np.ndarray, batches: Iterable[np.ndarray],
+                patterns: List[int], kth: List[int], jobs: int) -> None:
+    """ Print the k-th winners without playing the game """
+
+    # Only the win turn and unmarked sum of each board are kept
+    results = [(np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64))]
+    if jobs > 1:
+        with Pool(jobs) as pool:
+            for batch in batches:
+                results.extend(
+                    pool.starmap(rank_boards,
+                                 [(shard, draws, patterns)
+                                  for shard in np.array_split(batch, jobs)]))
+    else:
+        results.extend(
+            rank_boards(batch, draws, patterns) for batch in batches)
+
+    turns = np.concatenate([turns for turns, _ in results])
+    unmarked = np.concatenate([unmarked for _, unmarked in results])
+
+    # Boards that win on the same draw are reported in board order
+    order = np.argsort(turns, kind='stable')
+    winners = order[turns[order] < len(draws)]
+
+    for k in kth:
+        if not -len(winners) <= k <= len(winners):
+            print(f'No winner {k}')
+            continue
+
+        i = winners[k - 1 if k > 0 else k]
+        total, num = unmarked[i], draws[turns[i]]
+        print(f'Winner {i} = {total} * {num} = {total * num}')
+
+
+# --------------------------------------------------
+def rank_boards(boards: np.ndarray, draws: np.ndarray,
+                patterns: List[int]) -> Tuple[np.ndarray, np.ndarray]:
+    """ Find the turn each board wins and its unmarked sum then """
+
+    # Rank each cell by the turn its number is first drawn
+    never = len(draws)
+    order = np.argsort(draws, kind='stable')
+    ordered = draws[order]
+    pos = np.minimum(np.searchsorted(ordered, boards), max(never - 1, 0))
+    ranks = np.where(ordered[pos] == boards, order[pos], never) \
+        if never else np.full(boards.shape, never)
+
+    # A pattern is done at its last draw, and a board wins with its first
+    turns = np.full(len(boards), never)
+    for mask in patterns:
+        cells = [pos for pos in range(boards.shape[1]) if mask >> pos & 1]
+        turns = np.minimum(turns, ranks[:, cells].max(axis=1))
+    unmarked = np.where(ranks > turns[:, None], boards, 0).sum(axis=1)
+
+    return turns, unmarked
+
+
+# --------------------------------------------------
+def test_rank_boards() -> None:
+    """ Test rank_boards """
+
+    draws = np.array([7, 4, 9, 5, 11, 17, 23, 2, 0, 14, 21, 24, 10, 16])
+    boards = np.array([list(range(25)), [5, 11, 17, 23, 2] + [99] * 20])
+    patterns = make_patterns(5, ['rows', 'cols'])
+    turns, unmarked = rank_boards(boards, draws, patterns)
+
+    # The first board never wins, so its turn is past the last draw
+    assert turns.tolist() == [14, 7]
+    assert unmarked[1] == 99 * 20
+
+    turns, _ = rank_boards(boards, np.array([], dtype=np.int64), patterns)
+    assert turns.tolist() == [0, 0]
+
+    # The diagonal 0, 6, 12, 18, 24 is never drawn, but 0, 4, 20, 24 are
+    turns, _ = rank_boards(boards[:1], np.array([0, 4, 20, 24]),
+                           make_patterns(5, ['diagonals', 'corners']))
+    assert turns.tolist() == [3]
+
+
+# --------------------------------------------------
+def iter_boards(lines: Iterable[str], size: int,
+                batch_size: int) -> Iterator[np.ndarray]:
+    """ Parse boards into integer arrays, batch_size boards at a time """
+
+    area = size * size
+    if not area:
+        return
+
+    lines = iter(lines)
+    batch = np.empty((batch_size, area), dtype=np.int32)
+    filled = 0
+
+    # Boards are runs of area numbers, so blank lines need no handling
+    while chunk := list(islice(lines, min(batch_size, 4096) * (size + 1))):
+        nums = np.fromstring(''.join(chunk), dtype=np.int32, sep=' ')
+        while len(nums):
+            flat = batch.reshape(-1)
+            take = min(len(nums), len(flat) - filled)
+            flat[filled:filled + take] = nums[:take]
+            filled += take
+            nums = nums[take:]
+
+            if filled == len(flat):
+                yield batch
+                batch = np.empty((batch_size, area), dtype=np.int32)
+                filled = 0
+
+    if filled % area:
+        raise ValueError(f'Last board has {filled % area} of {area} numbers')
+
+    if filled:
+        yield batch[:filled // area]
+
+
+# --------------------------------------------------
+def test_iter_boards() -> None:
+    """ Test iter_boards """
+
+    lines = ['1 2\n', ' 3  4\n', '\n', '5 6\n', '7 8\n', '\n', '9 10\n',
+             '11 12\n']
+
+    batches = list(iter_boards(lines, 2, 2))
+    assert [batch.tolist() for batch in batches] == [
+        [[1, 2, 3, 4], [5, 6, 7, 8]], [[9, 10, 11, 12]]
     ]
-    assert find_winner(board3)
+    assert batches[0].dtype == np.int32
+    assert list(iter_boards([], 5, 10)) == []
+    assert list(iter_boards(['\n', '\n'], 0, 10)) == []
+
+
+# --------------------------------------------------
+def build_index(boards: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """ Sort all cells by number for finding the cells that have one """
+
+    # Stable, so the cells for a number stay in board and position order
+    flat = boards.reshape(-1)
+    cells = np.argsort(flat, kind='stable')
+
+    return flat[cells], cells
+
+
+# --------------------------------------------------
+def test_build_index() -> None:
+    """ Test build_index """
+
+    values, cells = build_index(np.array([[1, 2, 3, 4], [4, 5, 1, 1]]))
+
+    assert values.tolist() == [1, 1, 1, 2, 3, 4, 4, 5]
+    assert cells.tolist() == [0, 6, 7, 1, 2, 3, 4, 5]
 
 
 # --------------------------------------------------
@@ -0,0 +1,737 @@
+"""
+Author : Ken Youens-Clark <kyclark@gmail.com>
+Date   : 2021-12-05
+Purpose: Vent segment engines shared by vents.py and vents2.py
+"""
+
+import numpy as np
+from multiprocessing import Pool, shared_memory
+from typing import Iterator, List, NamedTuple, Optional, TextIO, Tuple
+
+MAX_POINTS = 1 << 24
+
+# Segment directions and the (a, b) of their lines a * x + b * y = key
+HORIZONTAL, VERTICAL, RISING, FALLING = range(4)
+DIRECTIONS = [(0, 1), (1, 0), (-1, 1), (1, 1)]
+
+# The puzzle's example vents for the tests
+EXAMPLE = np.array([[0, 9, 5, 9], [8, 0, 0, 8], [9, 4, 3, 4], [2, 2, 2, 1],
+                    [7, 0, 7, 4], [6, 4, 2, 0], [0, 9, 2, 9], [3, 4, 1, 4],
+                    [0, 0, 8, 8], [5, 5, 8, 2]])
+
+
+class Box(NamedTuple):
+    """ A bounding box of grid points """
+    min_x: int
+    min_y: int
+    width: int
+    height: int
+
+
+class Lines(NamedTuple):
+    """ Intervals on lines of one direction """
+    key: np.ndarray
+    low: np.ndarray
+    high: np.ndarray
+
+
+# --------------------------------------------------
+def read_segments(fh: TextIO) -> np.ndarray:
+    """ Read "x1,y1 -> x2,y2" lines into an (N, 4) array """
+
+    return parse_segments(fh.buffer.read())
+
+
+# --------------------------------------------------
+def parse_segments(data: bytes) -> np.ndarray:
+    """ Parse all the segments at once into an (N, 4) int32 array """
+
+    # Turn the separators into spaces so NumPy can read every number
+    nums = np.fromstring(data.replace(b'->', b'  ').replace(b',', b' '),
+                         dtype=np.int32,
+                         sep=' ')
+    if len(nums) % 4:
+        raise ValueError(f'Expected 4 numbers per segment, got {len(nums)}')
+
+    return nums.reshape(-1, 4)
+
+
+# --------------------------------------------------
+def test_parse_segments() -> None:
+    """ Test parse_segments """
+
+    segments = parse_segments(b'0,9 -> 5,9\n8,0->0,8\n  9, 4  ->  3 ,4 \n'
+                              b'-2,-1 -> 2,3')
+    assert segments.dtype == np.int32
+    assert segments.tolist() == [[0, 9, 5, 9], [8, 0, 0, 8], [9, 4, 3, 4],
+                                 [-2, -1, 2, 3]]
+
+    assert parse_segments(b'').shape == (0, 4)
+
+
+# --------------------------------------------------
+def select(segments: np.ndarray, diagonals: bool) -> np.ndarray:
+    """ Keep horizontal and vertical segments, and 45-degree if wanted """
+
+    x1, y1, x2, y2 = segments.astype(np.int64).T
+    straight = (x1 == x2) | (y1 == y2)
+    if diagonals:
+        straight |= np.abs(x2 - x1) == np.abs(y2 - y1)
+
+    return segments[straight]
+
+
+# --------------------------------------------------
+def test_select() -> None:
+    """ Test select """
+
+    segments = np.array([[0, 9, 5, 9], [8, 0, 0, 8], [2, 2, 2, 1],
+                         [1, 1, 4, 2]])
+
+    assert select(segments, False).tolist() == [[0, 9, 5, 9], [2, 2, 2, 1]]
+    assert select(segments, True).tolist() == [[0, 9, 5, 9], [8, 0, 0, 8],
+                                               [2, 2, 2, 1]]
+
+
+# --------------------------------------------------
+def points(segments: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """ Return the x and y of every point on the segments """
+
+    segments = segments.astype(np.int64)
+    x1, y1, x2, y2 = segments.T
+    lengths = np.maximum(np.abs(x2 - x1), np.abs(y2 - y1)) + 1
+
+    # Number each point by its segment and its step along that segment
+    seg = np.repeat(np.arange(len(segments)), lengths)
+    step = np.arange(len(seg)) - np.repeat(np.cumsum(lengths) - lengths,
+                                           lengths)
+
+    return (x1[seg] + np.sign(x2 - x1)[seg] * step,
+            y1[seg] + np.sign(y2 - y1)[seg] * step)
+
+
+# --------------------------------------------------
+def test_points() -> None:
+    """ Test points """
+
+    xs, ys = points(np.array([[1, 1, 1, 3], [9, 7, 7, 7], [3, 3, 1, 5]]))
+
+    assert list(zip(xs.tolist(), ys.tolist())) == [(1, 1), (1, 2), (1, 3),
+                                                   (9, 7), (8, 7), (7, 7),
+                                                   (3, 3), (2, 4), (1, 5)]
+
+    xs, ys = points(np.empty((0, 4), dtype=np.int64))
+    assert len(xs) == len(ys) == 0
+
+
+# --------------------------------------------------
+def chunks(segments: np.ndarray,
+           max_points: int = MAX_POINTS) -> Iterator[np.ndarray]:
+    """ Split segments into runs of about max_points points or fewer """
+
+    x1, y1, x2, y2 = segments.astype(np.int64).T
+    ends = np.cumsum(np.maximum(np.abs(x2 - x1), np.abs(y2 - y1)) + 1)
+
+    start = 0
+    while start < len(segments):
+        # Always take at least one segment, however long
+        done = ends[start - 1] if start else 0
+        stop = max(int(np.searchsorted(ends, done + max_points, 'right')),
+                   start + 1)
+        yield segments[start:stop]
+        start = stop
+
+
+# --------------------------------------------------
+def test_chunks() -> None:
+    """ Test chunks """
+
+    segments = np.array([[0, 0, 0, 2], [0, 0, 4, 0], [1, 1, 1, 1]])
+
+    assert [len(c) for c in chunks(segments, 100)] == [3]
+    assert [len(c) for c in chunks(segments, 8)] == [2, 1]
+    assert [len(c) for c in chunks(segments, 1)] == [1, 1, 1]
+    assert list(chunks(segments[:0], 10)) == []
+
+
+# --------------------------------------------------
+def count_dense(segments: np.ndarray) -> int:
+    """ Count points covered more than once using a dense grid """
+
+    if not len(segments):
+        return 0
+
+    box = bounds(segments)
+    grid = np.zeros(box.width * box.height, dtype=count_dtype(segments))
+    rasterize(segments, grid, box)
+
+    return int(np.count_nonzero(grid > 1))
+
+
+# --------------------------------------------------
+def count_dtype(segments: np.ndarray) -> type:
+    """ The smallest count type that no cell can overflow """
+
+    # Each segment covers a cell at most once
+    return np.uint16 if len(segments) < 2**16 else np.uint32
+
+
+# --------------------------------------------------
+def bounds(segments: np.ndarray) -> Box:
+    """ Find the bounding box of the segments """
+
+    xs, ys = segments[:, [0, 2]], segments[:, [1, 3]]
+    min_x, min_y = int(xs.min()), int(ys.min())
+
+    return Box(min_x, min_y,
+               int(xs.max()) - min_x + 1,
+               int(ys.max()) - min_y + 1)
+
+
+# --------------------------------------------------
+def rasterize(segments: np.ndarray, grid: np.ndarray, box: Box) -> None:
+    """ Add the points of the segments to a flat grid over box """
+
+    for chunk in chunks(segments):
+        xs, ys = points(chunk)
+        np.add.at(grid, (ys - box.min_y) * box.width + (xs - box.min_x), 1)
+
+
+# --------------------------------------------------
+def test_count_dense() -> None:
+    """ Test count_dense """
+
+    segments = EXAMPLE
+
+    assert count_dense(select(segments, False)) == 5
+    assert count_dense(select(segments, True)) == 12
+    assert count_dense(segments[:0]) == 0
+
+    # Enough copies to wrap a uint16 count back to 0
+    assert count_dense(np.tile([[0, 0, 3, 0]], (2**16, 1))) == 4
+
+
+# --------------------------------------------------
+def count_parallel(segments: np.ndarray, jobs: int) -> int:
+    """ Count points covered more than once, rasterizing in processes """
+
+    if not len(segments):
+        return 0
+
+    # Each worker fills its own row of a shared block of partial grids
+    box = bounds(segments)
+    size = box.width * box.height
+    dtype = count_dtype(segments)
+    shm = shared_memory.SharedMemory(create=True,
+                                     size=jobs * size *
+                                     np.dtype(dtype).itemsize)
+    try:
+        partials = np.ndarray((jobs, size), dtype=dtype, buffer=shm.buf)
+        partials[:] = 0
+
+        with Pool(jobs) as pool:
+            pool.starmap(rasterize_shared,
+                         [(shm.name, (jobs, size), dtype, row, shard, box)
+                          for row, shard in enumerate(
+                              np.array_split(segments, jobs))])
+
+        total = 0
+        for start in range(0, size, MAX_POINTS):
+            counts = partials[:, start:start + MAX_POINTS].sum(axis=0)
+            total += int(np.count_nonzero(counts > 1))
+
+        del partials
+    finally:
+        shm.close()
+        shm.unlink()
+
+    return total
+
+
+# --------------------------------------------------
+def rasterize_shared(name: str, shape: Tuple[int, int], dtype: type,
+                     row: int, segments: np.ndarray, box: Box) -> None:
+    """ Rasterize segments into one row of shared partial grids """
+
+    shm = shared_memory.SharedMemory(name=name)
+    try:
+        partials = np.ndarray(shape, dtype=dtype, buffer=shm.buf)
+        rasterize(segments, partials[row], box)
+        del partials
+    finally:
+        shm.close()
+
+
+# --------------------------------------------------
+def test_count_parallel() -> None:
+    """ Test count_parallel """
+
+    segments = EXAMPLE
+
+    assert count_parallel(select(segments, True), 3) == 12
+    assert count_parallel(select(segments, False), 2) == 5
+    assert count_parallel(segments[[0, 6]], 4) == 3
+    assert count_parallel(np.tile([[0, 0, 3, 0]], (2**16, 1)), 1) == 4
+
+
+# --------------------------------------------------
+def count_tiled(segments: np.ndarray,
+                tile_size: int,
+                filename: Optional[str] = None) -> int:
+    """ Count points covered more than once tile by tile, keeping the
+    grid in a memory-mapped file if given one """
+
+    if not len(segments):
+        return 0
+
+    min_x, min_y, width, height = bounds(segments)
+    dtype = count_dtype(segments)
+    segments = segments.astype(np.int64) - [min_x, min_y, min_x, min_y]
+
+    grid = np.memmap(filename, dtype=dtype, mode='w+',
+                     shape=(height, width)) if filename else None
+
+    total = 0
+    for (row, col), bucket in tiles(segments, tile_size):
+        top, left = row * tile_size, col * tile_size
+        bottom = min(top + tile_size, height)
+        right = min(left + tile_size, width)
+
+        # Each tile is rasterized once, in memory, then written out
+        tile = np.zeros((bottom - top, right - left), dtype=dtype)
+        for chunk in chunks(clip(bucket, left, right - 1, top, bottom - 1)):
+            xs, ys = points(chunk)
+            np.add.at(tile, (ys - top, xs - left), 1)
+
+        if grid is not None:
+            grid[top:bottom, left:right] = tile
+        total += int(np.count_nonzero(tile > 1))
+
+    if grid is not None:
+        grid.flush()
+        del grid
+
+    return total
+
+
+# --------------------------------------------------
+def test_count_tiled(tmp_path) -> None:
+    """ Test count_tiled """
+
+    segments = EXAMPLE
+
+    for tile_size in [1, 3, 4, 100]:
+        assert count_tiled(select(segments, False), tile_size) == 5
+        assert count_tiled(select(segments, True), tile_size) == 12
+
+    filename = str(tmp_path / 'grid.u16')
+    assert count_tiled(segments + 10, 4, filename) == 12
+    grid = np.fromfile(filename, dtype=np.uint16).reshape(10, 10)
+    assert grid[9].tolist() == [2, 2, 2, 1, 1, 1, 0, 0, 0, 0]
+
+    assert count_tiled(np.tile([[0, 0, 3, 0]], (2**16, 1)), 2) == 4
+
+
+# --------------------------------------------------
+def tiles(segments: np.ndarray,
+          tile_size: int) -> Iterator[Tuple[Tuple[int, int], np.ndarray]]:
+    """ Bucket segments by the tiles they pass through """
+
+    x1, y1, x2, y2 = segments.T
+    step_x, step_y = np.sign(x2 - x1), np.sign(y2 - y1)
+    num_cols = int(np.maximum(x1, x2).max()) // tile_size + 1
+
+    # A segment enters a new tile at its start and wherever it crosses
+    # a column or row boundary, so find the steps along it where it does
+    seg, step = [np.arange(len(segments))], [np.zeros(len(segments), int)]
+    for start, stop, sign in [(x1, x2, step_x), (y1, y2, step_y)]:
+        count = np.abs(stop // tile_size - start // tile_size)
+        first = np.where(sign > 0, tile_size - start % tile_size,
+                         start % tile_size + 1)
+        crossing = np.repeat(np.arange(len(segments)), count)
+        seg.append(crossing)
+        step.append(first[crossing] + tile_size *
+                    (np.arange(len(crossing)) -
+                     np.repeat(np.cumsum(count) - count, count)))
+
+    seg, step = np.concatenate(seg), np.concatenate(step)
+    cols = (x1[seg] + step_x[seg] * step) // tile_size
+    rows = (y1[seg] + step_y[seg] * step) // tile_size
+    tile = rows * num_cols + cols
+
+    # Sort the (segment, tile) pairs by tile, dropping repeats where a
+    # diagonal crosses a column and a row at once
+    order = np.lexsort((seg, tile))
+    tile, seg = tile[order], seg[order]
+    keep = np.ones(len(tile), dtype=bool)
+    keep[1:] = (tile[1:] != tile[:-1]) | (seg[1:] != seg[:-1])
+    tile, seg = tile[keep], seg[keep]
+
+    bounds = np.flatnonzero(np.diff(tile)) + 1
+    for start, stop in zip(np.r_[0, bounds], np.r_[bounds, len(tile)]):
+        row, col = divmod(int(tile[start]), num_cols)
+        yield (row, col), segments[seg[start:stop]]
+
+
+# --------------------------------------------------
+def test_tiles() -> None:
+    """ Test tiles """
+
+    # Every segment lands in exactly the tiles holding its points
+    rng = np.random.default_rng(2)
+    x1, y1 = rng.integers(0, 40, (2, 50))
+    size = rng.integers(0, 30, 50)
+    dx, dy = rng.integers(-1, 2, (2, 50))
+    segments = np.stack([x1, y1, x1 + dx * size, y1 + dy * size], axis=1)
+    segments = segments[(segments >= 0).all(axis=1)]
+
+    for tile_size in [1, 3, 7, 100]:
+        found = {(tile, tuple(row)) for tile, bucket in tiles(
+            segments, tile_size) for row in bucket.tolist()}
+        expected = set()
+        for row in segments:
+            xs, ys = points(row[None])
+            expected |= {((y // tile_size, x // tile_size), tuple(row))
+                         for x, y in zip(xs.tolist(), ys.tolist())}
+        assert found == expected
+
+    # A long diagonal lands in the tiles on its path, not its whole box
+    diagonal = np.array([[0, 0, 999, 999]])
+    assert [tile for tile, _ in tiles(diagonal, 10)] == [
+        (i, i) for i in range(100)
+    ]
+
+
+# --------------------------------------------------
+def clip(segments: np.ndarray, left: int, right: int, top: int,
+         bottom: int) -> np.ndarray:
+    """ Clip segments to the parts inside a box """
+
+    x1, y1, x2, y2 = segments.astype(np.int64).T
+    step_x, step_y = np.sign(x2 - x1), np.sign(y2 - y1)
+    first = np.zeros(len(segments), dtype=np.int64)
+    last = np.maximum(np.abs(x2 - x1), np.abs(y2 - y1))
+
+    # Narrow the steps along each segment that stay within the box
+    for start, step, low, high in [(x1, step_x, left, right),
+                                   (y1, step_y, top, bottom)]:
+        first = np.maximum(
+            first,
+            np.where(step > 0, low - start, np.where(step < 0, start - high,
+                                                     0)))
+        last = np.minimum(
+            last,
+            np.where(step > 0, high - start,
+                     np.where(step < 0, start - low, last)))
+        last[(step == 0) & ((start < low) | (start > high))] = -1
+
+    keep = first <= last
+    return np.stack([
+        x1 + step_x * first, y1 + step_y * first, x1 + step_x * last,
+        y1 + step_y * last
+    ], axis=1)[keep]
+
+
+# --------------------------------------------------
+def test_clip() -> None:
+    """ Test clip """
+
+    segments = np.array([[0, 0, 9, 9], [9, 0, 0, 9], [0, 5, 9, 5],
+                         [5, 9, 5, 0], [0, 0, 1, 1]])
+
+    assert clip(segments, 3, 6, 2, 4).tolist() == [[3, 3, 4, 4],
+                                                   [6, 3, 5, 4],
+                                                   [5, 4, 5, 2]]
+    assert clip(segments, 0, 9, 0, 9).tolist() == segments.tolist()
+
+
+# --------------------------------------------------
+def count_sweep(segments: np.ndarray) -> int:
+    """ Count points covered more than once without a grid """
+
+    # Points covered by lines of two different directions are all found
+    # as crossings; any others must be collinear overlaps
+    families = to_lines(segments)
+    unions = [spans(*family, 1) for family in families]
+    overlaps = [spans(*family, 2) for family in families]
+
+    crossed = [
+        crossings(f, unions[f], g, unions[g])
+        for f in range(len(families)) for g in range(f + 1, len(families))
+    ]
+    xs = np.concatenate([xs for xs, _ in crossed])
+    ys = np.concatenate([ys for _, ys in crossed])
+    if len(xs):
+        xs, ys = np.unique(np.stack([xs, ys], axis=1), axis=0).T
+
+    total = len(xs)
+    for f, (key, start, end) in enumerate(overlaps):
+        qkey, qpos = key_param(f, xs, ys)
+        total += int((end - start + 1).sum())
+        total -= int(np.count_nonzero(covered(key, start, end, qkey, qpos)))
+
+    return total
+
+
+# --------------------------------------------------
+def test_count_sweep() -> None:
+    """ Test count_sweep """
+
+    segments = EXAMPLE
+
+    assert count_sweep(select(segments, False)) == 5
+    assert count_sweep(select(segments, True)) == 12
+    assert count_sweep(segments[:0]) == 0
+
+    # Rising and falling diagonals that cross between cells
+    assert count_sweep(np.array([[0, 0, 1, 1], [0, 1, 1, 0]])) == 0
+
+    rng = np.random.default_rng(1)
+    for _ in range(20):
+        x1, y1 = rng.integers(-20, 20, (2, 60))
+        size = rng.integers(0, 15, 60)
+        dx, dy = rng.integers(-1, 2, (2, 60))
+        segments = np.stack([x1, y1, x1 + dx * size, y1 + dy * size], axis=1)
+        assert count_sweep(segments) == count_dense(segments)
+
+    # Far too big for a grid
+    assert count_sweep(np.array([[0, 0, 10**9, 0], [5, 0, 2 * 10**9, 0],
+                                 [7, -10**9, 7, 10**9]])) == 10**9 - 4
+
+
+# --------------------------------------------------
+def to_lines(segments: np.ndarray) -> List[Lines]:
+    """ Split 45-degree and axis-aligned segments by direction """
+
+    x1, y1, x2, y2 = segments.astype(np.int64).T
+    horz = y1 == y2
+    vert = (x1 == x2) & ~horz
+    rising = ~horz & ~vert & ((x2 - x1) == (y2 - y1))
+    falling = ~horz & ~vert & ~rising
+    low_x, high_x = np.minimum(x1, x2), np.maximum(x1, x2)
+
+    return [
+        Lines(y1[horz], low_x[horz], high_x[horz]),
+        Lines(x1[vert], np.minimum(y1, y2)[vert], np.maximum(y1, y2)[vert]),
+        Lines((y1 - x1)[rising], low_x[rising], high_x[rising]),
+        Lines((x1 + y1)[falling], low_x[falling], high_x[falling]),
+    ]
+
+
+# --------------------------------------------------
+def key_param(family: int, xs: np.ndarray,
+              ys: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """ Find the line (key) through points and their place on it """
+
+    # Each direction's line is a * x + b * y = key, measured along x or y
+    a, b = DIRECTIONS[family]
+    return a * xs + b * ys, ys if family == VERTICAL else xs
+
+
+# --------------------------------------------------
+def spans(key: np.ndarray, low: np.ndarray, high: np.ndarray,
+          depth: int) -> Lines:
+    """ Merge intervals on the same lines to where depth or more overlap """
+
+    if not len(key):
+        return Lines(key, low, high)
+
+    # Sweep +1/-1 events in (key, position) order; each line's events
+    # sum to zero, so one running total serves every line
+    keys = np.concatenate([key, key])
+    pos = np.concatenate([low, high + 1])
+    order = np.lexsort((pos, keys))
+    keys, pos = keys[order], pos[order]
+    cover = np.cumsum(np.concatenate([np.ones_like(key),
+                                      -np.ones_like(key)])[order])
+
+    keep = (keys[:-1] == keys[1:]) & (pos[1:] > pos[:-1]) & \
+        (cover[:-1] >= depth)
+    key, start, end = keys[:-1][keep], pos[:-1][keep], pos[1:][keep] - 1
+
+    # Join pieces that touch
+    first = np.ones(len(key), dtype=bool)
+    first[1:] = (key[1:] != key[:-1]) | (start[1:] != end[:-1] + 1)
+    last = np.roll(first, -1)
+
+    return Lines(key[first], start[first], end[last])
+
+
+# --------------------------------------------------
+def test_spans() -> None:
+    """ Test spans """
+
+    key = np.array([0, 0, 0, 1, 0])
+    low = np.array([0, 3, 10, 0, 6])
+    high = np.array([5, 8, 12, 0, 7])
+
+    assert [s.tolist() for s in spans(key, low, high, 1)] == [[0, 0, 1],
+                                                              [0, 10, 0],
+                                                              [8, 12, 0]]
+    assert [s.tolist() for s in spans(key, low, high, 2)] == [[0], [3], [7]]
+
+
+# --------------------------------------------------
+def crossings(f: int, first: Lines, g: int,
+              second: Lines) -> Tuple[np.ndarray, np.ndarray]:
+    """ Find the points where lines of two directions cross """
+
+    if not len(first.key) or not len(second.key):
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+
+    # Measured by the key of the other direction, lines of f run across
+    # at height key f and lines of g run up at key g, so lines cross
+    # where those intervals meet
+    f_ends = [key_param(g, *to_point(f, first.key, pos))[0]
+              for pos in (first.low, first.high)]
+    g_ends = [key_param(f, *to_point(g, second.key, pos))[0]
+              for pos in (second.low, second.high)]
+    fi, gi = meetings(first.key, np.minimum(*f_ends), np.maximum(*f_ends),
+                      second.key, np.minimum(*g_ends), np.maximum(*g_ends))
+
+    # Solve the two line equations; diagonals can cross between cells
+    (a1, b1), (a2, b2) = DIRECTIONS[f], DIRECTIONS[g]
+    det = a1 * b2 - a2 * b1
+    k1, k2 = first.key[fi], second.key[gi]
+    x_num, y_num = k1 * b2 - k2 * b1, a1 * k2 - a2 * k1
+    whole = (x_num % abs(det) == 0) & (y_num % abs(det) == 0)
+
+    return x_num[whole] // det, y_num[whole] // det
+
+
+# --------------------------------------------------
+def meetings(h_key: np.ndarray, h_low: np.ndarray, h_high: np.ndarray,
+             v_key: np.ndarray, v_low: np.ndarray,
+             v_high: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """ Pair the horizontal and vertical intervals that meet """
+
+    # Number the rows of the horizontals; spans on one row never touch,
+    # so each row holds at most one active horizontal at a time
+    rows, row = np.unique(h_key, return_inverse=True)
+    row = row.ravel().tolist()
+    bottom = np.searchsorted(rows, v_low, 'left').tolist()
+    top = np.searchsorted(rows, v_high, 'right').tolist()
+    size = len(rows)
+
+    # Sweep across, adding horizontals before and removing them after
+    # the verticals at the same position
+    nh, nv = len(h_key), len(v_key)
+    pos = np.concatenate([h_low, v_key, h_high])
+    kind = np.repeat([0, 1, 2], [nh, nv, nh])
+    index = np.concatenate([np.arange(nh), np.arange(nv), np.arange(nh)])
+    order = np.lexsort((kind, pos))
+
+    # A Fenwick tree counts the active rows and finds the next one up
+    tree = [0] * (size + 1)
+    owner = [0] * size
+    high_bit = 1 << size.bit_length()
+    h_found: List[int] = []
+    v_found: List[int] = []
+
+    for k, i in zip(kind[order].tolist(), index[order].tolist()):
+        if k != 1:
+            j, step = row[i] + 1, 1 if k == 0 else -1
+            owner[j - 1] = i
+            while j <= size:
+                tree[j] += step
+                j += j & -j
+            continue
+
+        lo, hi = bottom[i], top[i]
+        if lo >= hi:
+            continue
+
+        below, j = 0, lo
+        while j:
+            below += tree[j]
+            j &= j - 1
+        above, j = 0, hi
+        while j:
+            above += tree[j]
+            j &= j - 1
+
+        for rank in range(below, above):
+            # Descend to the first row with more than rank rows under it
+            j, rest, bit = 0, rank, high_bit
+            while bit:
+                if j + bit <= size and tree[j + bit] <= rest:
+                    j += bit
+                    rest -= tree[j]
+                bit >>= 1
+            h_found.append(owner[j])
+            v_found.append(i)
+
+    return (np.array(h_found, dtype=np.int64),
+            np.array(v_found, dtype=np.int64))
+
+
+# --------------------------------------------------
+def test_meetings() -> None:
+    """ Test meetings """
+
+    h_key, h_low, h_high = np.array([0, 2, 2, 5]), np.array(
+        [0, 0, 6, 3]), np.array([4, 4, 9, 3])
+    v_key, v_low, v_high = np.array([3, 4, 7, 10]), np.array(
+        [0, 1, 0, 0]), np.array([5, 2, 2, 9])
+
+    fi, gi = meetings(h_key, h_low, h_high, v_key, v_low, v_high)
+    assert sorted(zip(fi.tolist(), gi.tolist())) == [(0, 0), (1, 0), (1, 1),
+                                                     (2, 2), (3, 0)]
+
+    # Every vertical is in range of every row but never meets its span,
+    # which a scan over candidate pairs would take a long time to find
+    n = 200_000
+    fi, gi = meetings(np.arange(n), np.zeros(n, dtype=np.int64),
+                      np.full(n, 10), np.arange(n) + 20,
+                      np.zeros(n, dtype=np.int64), np.full(n, n))
+    assert len(fi) == len(gi) == 0
+
+
+# --------------------------------------------------
+def to_point(family: int, key: np.ndarray,
+             pos: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """ Find the points at pos along lines """
+
+    if family == HORIZONTAL:
+        return pos, key
+    if family == VERTICAL:
+        return key, pos
+    if family == RISING:
+        return pos, pos + key
+    return pos, key - pos
+
+
+# --------------------------------------------------
+def covered(key: np.ndarray, start: np.ndarray, end: np.ndarray,
+            qkey: np.ndarray, qpos: np.ndarray) -> np.ndarray:
+    """ Check which query points fall in the sorted, disjoint spans """
+
+    if not len(key) or not len(qkey):
+        return np.zeros(len(qkey), dtype=bool)
+
+    # Number the lines densely so (line, position) fits in one int64
+    keys = np.unique(key)
+    base = min(start.min(), qpos.min())
+    width = max(end.max(), qpos.max()) - base + 1
+    codes = np.searchsorted(keys, key) * width + (start - base)
+
+    rank = np.minimum(np.searchsorted(keys, qkey), len(keys) - 1)
+    i = np.searchsorted(codes, rank * width + (qpos - base), 'right') - 1
+    found = i >= 0
+    i = np.maximum(i, 0)
+
+    return found & (key[i] == qkey) & (qpos <= end[i])
+
+
+# --------------------------------------------------
+def test_covered() -> None:
+    """ Test covered """
+
+    key, start, end = np.array([0, 0, 3]), np.array([1, 5, 0]), np.array(
+        [2, 9, 0])
+    qkey, qpos = np.array([0, 0, 0, 0, 3, 3, 2]), np.array([0, 1, 3, 9, 0, 1,
+                                                            1])
+
+    assert covered(key, start, end, qkey, qpos).tolist() == [
+        False, True, False, True, True, False, False
+    ]
@@ -8,12 +8,19 @@ Purpose: Rock the Casbah
 import argparse
 import sys
 from collections import defaultdict
-from typing import NamedTuple, TextIO
+from typing import NamedTuple, Optional, TextIO
+from segments import (count_dense, count_sweep, count_tiled, read_segments,
+                      select)
 
 
 class Args(NamedTuple):
     """ Command-line arguments """
     file: TextIO
+    dense: bool
+    sweep: bool
+    tiled: bool
+    tile_size: int
+    grid_file: Optional[str]
 
 
 # --------------------------------------------------
@@ -31,9 +38,46 @@ def get_args() -> Args:
                         type=argparse.FileType('rt'),
                         default=sys.stdin)
 
+    parser.add_argument('-d',
+                        '--dense',
+                        help='Count on a dense NumPy grid',
+                        action='store_true')
+
+    parser.add_argument('-s',
+                        '--sweep',
+                        help='Count overlaps and crossings without a grid',
+                        action='store_true')
+
+    parser.add_argument('-t',
+                        '--tiled',
+                        help='Count tile by tile, holding one tile at a time',
+                        action='store_true')
+
+    parser.add_argument('-T',
+                        '--tile-size',
+                        help='Tile width and height for --tiled',
+                        metavar='INT',
+                        type=int,
+                        default=4096)
+
+    parser.add_argument('-g',
+                        '--grid-file',
+                        help='Keep the --tiled count grid in this file, as '
+                        'uint16 or as uint32 from 65536 segments',
+                        metavar='FILE',
+                        type=str)
+
     args = parser.parse_args()
 
-    return Args(args.file)
+    if args.tile_size < 1:
+        parser.error(f'--tile-size "{args.tile_size}" must be > 0')
+
+    tiled = args.tiled or bool(args.grid_file)
+    if args.dense + args.sweep + tiled > 1:
+        parser.error('Choose only one of --dense, --sweep, and --tiled')
+
+    return Args(args.file, args.dense, args.sweep, tiled, args.tile_size,
+                args.grid_file)
 
 
 # --------------------------------------------------
@@ -41,14 +85,21 @@ def main() -> None:
     """ Make a jazz noise here """
 
     args = get_args()
-    grid = defaultdict(int)
+    segments = read_segments(args.file)
+
+    if args.dense or args.sweep or args.tiled:
+        segments = select(segments, False)
+        if args.sweep:
+            print(count_sweep(segments))
+        elif args.tiled:
+            print(count_tiled(segments, args.tile_size, args.grid_file))
+        else:
+            print(count_dense(segments))
+        return
 
-    for line in map(str.rstrip, args.file):
-        # print(f'>>> line {line}')
-        start, _, stop = line.split(' ')
-        x1, y1 = map(int, start.split(','))
-        x2, y2 = map(int, stop.split(','))
+    grid = defaultdict(int)
 
+    for x1, y1, x2, y2 in segments.tolist():
         if not (x1 == x2 or y1 == y2):
             continue
 
@@ -9,12 +9,21 @@ import argparse
 import sys
 from itertools import zip_longest
 from collections import defaultdict
-from typing import NamedTuple, TextIO
+from typing import NamedTuple, Optional, TextIO
+from segments import (count_dense, count_parallel, count_sweep, count_tiled,
+                      read_segments, select)
 
 
 class Args(NamedTuple):
     """ Command-line arguments """
     file: TextIO
+    dense: bool
+    sweep: bool
+    tiled: bool
+    tile_size: int
+    grid_file: Optional[str]
+    jobs: int
+    debug: bool
 
 
 # --------------------------------------------------
@@ -32,9 +41,64 @@ def get_args() -> Args:
                         type=argparse.FileType('rt'),
                         default=sys.stdin)
 
+    parser.add_argument('-d',
+                        '--dense',
+                        help='Count on a dense NumPy grid',
+                        action='store_true')
+
+    parser.add_argument('-s',
+                        '--sweep',
+                        help='Count overlaps and crossings without a grid',
+                        action='store_true')
+
+    parser.add_argument('-t',
+                        '--tiled',
+                        help='Count tile by tile, holding one tile at a time',
+                        action='store_true')
+
+    parser.add_argument('-T',
+                        '--tile-size',
+                        help='Tile width and height for --tiled',
+                        metavar='INT',
+                        type=int,
+                        default=4096)
+
+    parser.add_argument('-g',
+                        '--grid-file',
+                        help='Keep the --tiled count grid in this file, as '
+                        'uint16 or as uint32 from 65536 segments',
+                        metavar='FILE',
+                        type=str)
+
+    parser.add_argument('-j',
+                        '--jobs',
+                        help='Number of processes for dense rasterizing',
+                        metavar='INT',
+                        type=int,
+                        default=1)
+
+    parser.add_argument('-D',
+                        '--debug',
+                        help='Print each line, point, and the grid',
+                        action='store_true')
+
     args = parser.parse_args()
 
-    return Args(args.file)
+    if args.tile_size < 1:
+        parser.error(f'--tile-size "{args.tile_size}" must be > 0')
+
+    if args.jobs < 1:
+        parser.error(f'--jobs "{args.jobs}" must be > 0')
+
+    tiled = args.tiled or bool(args.grid_file)
+    if args.dense + args.sweep + tiled > 1:
+        parser.error('Choose only one of --dense, --sweep, and --tiled')
+
+    if args.jobs > 1 and (args.sweep or tiled):
+        parser.error('--jobs only works with --dense')
+
+    return Args(args.file, args.dense, args.sweep, tiled, args.tile_size,
+                args.grid_file, args.jobs, args.debug)
 
 
 # --------------------------------------------------
@@ -42,31 +106,43 @@ def main() -> None:
     """ Make a jazz noise here """
 
     args = get_args()
-    grid = defaultdict(int)
+    segments = read_segments(args.file)
+
+    if args.dense or args.sweep or args.tiled or args.jobs > 1:
+        segments = select(segments, True)
+        if args.jobs > 1:
+            print(count_parallel(segments, args.jobs))
+        elif args.sweep:
+            print(count_sweep(segments))
+        elif args.tiled:
+            print(count_tiled(segments, args.tile_size, args.grid_file))
+        else:
+            print(count_dense(segments))
+        return
 
-    for line in map(str.rstrip, args.file):
-        print(f'>>> line {line}')
-        start, _, stop = line.split(' ')
-        x1, y1 = map(int, start.split(','))
-        x2, y2 = map(int, stop.split(','))
+    grid = defaultdict(int)
 
+    for x1, y1, x2, y2 in segments.tolist():
         xs = list(range(x1, x2 - 1, -1) if x1 > x2 else range(x1, x2 + 1))
         ys = list(range(y1, y2 - 1, -1) if y1 > y2 else range(y1, y2 + 1))
 
-        print(f'({x1}, {y1}) -> ({x2}, {y2})')
+        if args.debug:
+            print(f'({x1}, {y1}) -> ({x2}, {y2})')
         prev_x, prev_y = None, None
 
         for x, y in zip_longest(xs, ys):
             x = prev_x if x is None else x
             y = prev_y if y is None else y
 
-            print(f'({x}, {y})')
+            if args.debug:
+                print(f'({x}, {y})')
             grid[(x, y)] += 1
 
             prev_x = x
             prev_y = y
 
-    show_grid(grid)
+    if args.debug:
+        show_grid(grid)
     print(len([v for v in grid.values() if v > 1]))
 
 
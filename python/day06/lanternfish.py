@@ -7,13 +7,22 @@ Purpose: Rock the Casbah
 
 import argparse
 import os
-from typing import NamedTuple, TextIO
+import numpy as np
+from typing import List, NamedTuple, Optional, TextIO
+from lifecycle import NEWBORN, RESET, count_school, open_cache
+
+CHUNK_SIZE = 64 * 1024 * 1024
 
 
 class Args(NamedTuple):
     """ Command-line arguments """
     state: str
     days: int
+    array: bool
+    reset: int
+    newborn: int
+    descendants: bool
+    cache: Optional[str]
 
 
 # --------------------------------------------------
@@ -33,12 +42,49 @@ def get_args() -> Args:
                         default=80,
                         help='Number of days for simulation')
 
+    parser.add_argument('-a',
+                        '--array',
+                        help='Keep each fish\'s timer in an int8 array',
+                        action='store_true')
+
+    parser.add_argument('-r',
+                        '--reset',
+                        metavar='INT',
+                        type=int,
+                        default=RESET,
+                        help='Timer of a fish after spawning')
+
+    parser.add_argument('-n',
+                        '--newborn',
+                        metavar='INT',
+                        type=int,
+                        default=NEWBORN,
+                        help='Timer of a newborn fish')
+
+    parser.add_argument('-D',
+                        '--descendants',
+                        help='Sum the memoized descendants of each fish',
+                        action='store_true')
+
+    parser.add_argument('-c',
+                        '--cache',
+                        metavar='FILE',
+                        type=str,
+                        help='Keep descendant counts in this sqlite file')
+
     args = parser.parse_args()
 
+    if not 0 <= args.reset <= 127:
+        parser.error(f'--reset "{args.reset}" must be from 0 to 127')
+
+    if not 0 <= args.newborn <= 127:
+        parser.error(f'--newborn "{args.newborn}" must be from 0 to 127')
+
     if os.path.isfile(args.state):
         args.state = open(args.state).read().rstrip()
 
-    return Args(args.state, args.days)
+    return Args(args.state, args.days, args.array, args.reset, args.newborn,
+                args.descendants or args.cache is not None, args.cache)
 
 
 # --------------------------------------------------
@@ -48,6 +94,17 @@ def main() -> None:
     args = get_args()
     ages = list(map(int, args.state.split(',')))
 
+    if args.descendants:
+        cache = open_cache(args.cache) if args.cache else None
+        total = count_school(ages, args.days, args.reset, args.newborn, cache)
+        print(f'There are {total} fish')
+        return
+
+    if args.array:
+        timers = simulate_fish(ages, args.days, args.reset, args.newborn)
+        print(f'There are {len(timers)} fish')
+        return
+
     print(f'Initial state: {",".join(map(str, ages))}')
 
     for day in range(1, args.days + 1):
@@ -55,8 +112,8 @@ def main() -> None:
         cur, new = [], []
         for num in ages:
             if num == 0:
-                cur.append(6)
-                new.append(8)
+                cur.append(args.reset)
+                new.append(args.newborn)
             else:
                 cur.append(num - 1)
         ages = cur + new
@@ -67,6 +124,63 @@ def main() -> None:
     print(f'There are {len(ages)} fish')
 
 
+# --------------------------------------------------
+def simulate_fish(ages: List[int],
+                  days: int,
+                  reset: int = RESET,
+                  newborn: int = NEWBORN,
+                  chunk_size: int = CHUNK_SIZE) -> np.ndarray:
+    """ Run the timers of every fish, appending newborns at the end """
+
+    # Fish never move, so index i is the same fish on every day
+    timers = np.array(ages, dtype=np.int8)
+    num = len(timers)
+
+    for _ in range(days):
+        # Chunks bound the temporary masks to chunk_size bytes
+        born = sum(
+            count_down(timers[start:min(start + chunk_size, num)], reset)
+            for start in range(0, num, chunk_size))
+
+        if num + born > len(timers):
+            # Resize in place where possible rather than copy; no views
+            # of timers outlive count_down, so none can dangle
+            timers.resize(max(num + born, len(timers) * 3 // 2),
+                          refcheck=False)
+        timers[num:num + born] = newborn
+        num += born
+
+    return timers[:num]
+
+
+# --------------------------------------------------
+def count_down(timers: np.ndarray, reset: int) -> int:
+    """ Count down timers in place, returning how many fish spawn """
+
+    born = int(np.count_nonzero(timers == 0))
+    timers -= 1
+    np.putmask(timers, timers < 0, reset)
+
+    return born
+
+
+# --------------------------------------------------
+def test_simulate_fish() -> None:
+    """ Test simulate_fish """
+
+    ages = [3, 4, 3, 1, 2]
+
+    assert simulate_fish(ages, 0).tolist() == ages
+    assert simulate_fish(ages, 3).tolist() == [0, 1, 0, 5, 6, 7, 8]
+    assert simulate_fish(ages, 18).tolist() == [
+        6, 0, 6, 4, 5, 6, 0, 1, 1, 2, 6, 0, 1, 1, 1, 2, 2, 3, 3, 4, 6, 7, 8,
+        8, 8, 8
+    ]
+    assert len(simulate_fish(ages, 80)) == 5934
+    assert len(simulate_fish(ages, 80, chunk_size=7)) == 5934
+    assert simulate_fish([1], 4, 1, 2).tolist() == [1, 0, 2]
+
+
 # --------------------------------------------------
 if __name__ == '__main__':
     main()
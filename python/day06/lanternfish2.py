@@ -7,15 +7,28 @@ Purpose: Rock the Casbah
 
 import argparse
 import os
+import re
+import numpy as np
 from pprint import pprint
-from collections import defaultdict
-from typing import NamedTuple, TextIO
+from typing import List, NamedTuple, Optional, TextIO
+from lifecycle import (NEWBORN, RESET, count_school, descendants,
+                       open_cache)
+
+Matrix = List[List[int]]
 
 
 class Args(NamedTuple):
     """ Command-line arguments """
     state: str
-    days: int
+    days: List[int]
+    matrix: bool
+    mod: Optional[int]
+    outfile: Optional[str]
+    batch: bool
+    reset: int
+    newborn: int
+    descendants: bool
+    cache: Optional[str]
 
 
 # --------------------------------------------------
@@ -26,21 +39,123 @@ def get_args() -> Args:
         description='Rock the Casbah',
         formatter_class=argparse.ArgumentDefaultsHelpFormatter)
 
-    parser.add_argument('state', metavar='STR', help='Starting ages')
+    parser.add_argument('state',
+                        metavar='STR',
+                        help='Starting ages, or a file of them per line')
 
     parser.add_argument('-d',
                         '--days',
+                        metavar='STR',
+                        type=str,
+                        default='80',
+                        help='Days for simulation, e.g., "80" or '
+                        '"1,18,80..256"')
+
+    parser.add_argument('-m',
+                        '--matrix',
+                        help='Raise the daily transition matrix to the days',
+                        action='store_true')
+
+    parser.add_argument('-M',
+                        '--mod',
+                        metavar='INT',
+                        type=int,
+                        help='Count fish modulo this number')
+
+    parser.add_argument('-o',
+                        '--outfile',
+                        metavar='FILE',
+                        type=str,
+                        help='Save (day, fish) counts to this .npy file')
+
+    parser.add_argument('-b',
+                        '--batch',
+                        help='Simulate each line of the state as a school',
+                        action='store_true')
+
+    parser.add_argument('-r',
+                        '--reset',
+                        metavar='INT',
+                        type=int,
+                        default=RESET,
+                        help='Timer of a fish after spawning')
+
+    parser.add_argument('-n',
+                        '--newborn',
                         metavar='INT',
                         type=int,
-                        default=80,
-                        help='Number of days for simulation')
+                        default=NEWBORN,
+                        help='Timer of a newborn fish')
+
+    parser.add_argument('-D',
+                        '--descendants',
+                        help='Sum the memoized descendants of each fish',
+                        action='store_true')
+
+    parser.add_argument('-c',
+                        '--cache',
+                        metavar='FILE',
+                        type=str,
+                        help='Keep descendant counts in this sqlite file')
 
     args = parser.parse_args()
 
+    days = parse_days(args.days)
+    if not days:
+        parser.error(f'Invalid --days "{args.days}"')
+
+    if args.mod is not None and args.mod < 1:
+        parser.error(f'--mod "{args.mod}" must be > 0')
+
+    if args.reset < 0:
+        parser.error(f'--reset "{args.reset}" must be >= 0')
+
+    if args.newborn < 0:
+        parser.error(f'--newborn "{args.newborn}" must be >= 0')
+
+    descendants = args.descendants or args.cache is not None
+    if args.batch and (args.matrix or descendants):
+        parser.error('--batch cannot be used with --matrix or --descendants')
+
     if os.path.isfile(args.state):
         args.state = open(args.state).read().rstrip()
 
-    return Args(args.state, args.days)
+    lines = [line for line in args.state.splitlines() if line.strip()]
+    if not all(re.search(r'^\s*\d+(\s*,\s*\d+)*\s*$', line)
+               for line in lines) or (not args.batch and len(lines) != 1):
+        parser.error(f'Invalid ages "{args.state}"')
+
+    return Args(args.state, days, args.matrix, args.mod, args.outfile,
+                args.batch, args.reset, args.newborn, descendants, args.cache)
+
+
+# --------------------------------------------------
+def parse_days(val: str) -> List[int]:
+    """ Parse a list of days and inclusive ranges """
+
+    days = []
+    for part in val.split(','):
+        if match := re.search(r'^\s*(\d+)\s*(?:\.\.\s*(\d+)\s*)?$', part):
+            start = int(match.group(1))
+            stop = int(match.group(2) or start)
+            if stop < start:
+                return []
+            days.extend(range(start, stop + 1))
+        else:
+            return []
+
+    return sorted(set(days))
+
+
+# --------------------------------------------------
+def test_parse_days() -> None:
+    """ Test parse_days """
+
+    assert parse_days('80') == [80]
+    assert parse_days('0,18,3..5') == [0, 3, 4, 5, 18]
+    assert parse_days('5..1') == []
+    assert parse_days('') == []
+    assert parse_days('-1') == []
 
 
 # --------------------------------------------------
@@ -48,22 +163,305 @@ def main() -> None:
     """ Make a jazz noise here """
 
     args = get_args()
-    ages = defaultdict(int)
-    for age in map(int, args.state.split(',')):
-        ages[age] += 1
-
-    for day in range(1, args.days + 1):
-        print(f'Day {day:04d}')
-        new = defaultdict(int)
-        for age, num in ages.items():
-            if age == 0:
-                new[6] += num
-                new[8] += num
-            else:
-                new[age - 1] += num
-        ages = new
-
-    print(f'There are {sum(ages.values())} fish')
+    size = max(args.reset, args.newborn) + 1
+
+    if args.batch:
+        totals = simulate_batch(read_schools(args.state, size), args.days,
+                                args.mod, args.reset, args.newborn)
+        if args.outfile:
+            np.save(args.outfile, totals, allow_pickle=totals.dtype == object)
+        else:
+            for row in totals:
+                print('\t'.join(map(str, row)))
+        return
+
+    ages = list(map(int, args.state.split(',')))
+    if args.descendants:
+        cache = open_cache(args.cache) if args.cache else None
+        totals = [
+            count_school(ages, day, args.reset, args.newborn, cache)
+            for day in args.days
+        ]
+        if args.mod:
+            totals = [total % args.mod for total in totals]
+    else:
+        # Fish older than a newborn need more slots than the lifecycle
+        counts = [0] * max(size, max(ages) + 1)
+        for age in ages:
+            counts[age] += 1
+
+        if args.matrix:
+            totals = [
+                count_fish(counts, day, args.mod, args.reset, args.newborn)
+                for day in args.days
+            ]
+        else:
+            totals = simulate(counts, args.days, args.mod, args.reset,
+                              args.newborn)
+
+    if args.outfile:
+        save_series(args.outfile, args.days, totals)
+    elif len(args.days) == 1:
+        print(f'There are {totals[0]} fish')
+    else:
+        for day, total in zip(args.days, totals):
+            print(f'Day {day}: There are {total} fish')
+
+
+# --------------------------------------------------
+def simulate(counts: List[int],
+             days: List[int],
+             mod: Optional[int] = None,
+             reset: int = RESET,
+             newborn: int = NEWBORN) -> List[int]:
+    """ Count the fish on each of the sorted days in one simulation """
+
+    # A ring of counts where the age of slot i is (i - head) % size
+    ring = counts[:]
+    size = len(ring)
+    head, day = 0, 0
+    totals = []
+
+    for target in days:
+        while day < target:
+            # The fish at 0 wrap to the last slot, then move to their ages
+            head = (head + 1) % size
+            last = (head + size - 1) % size
+            born, ring[last] = ring[last], 0
+            for age in reset, newborn:
+                ring[(head + age) % size] += born
+                if mod:
+                    ring[(head + age) % size] %= mod
+            day += 1
+
+        totals.append(sum(ring) % mod if mod else sum(ring))
+
+    return totals
+
+
+# --------------------------------------------------
+def test_simulate() -> None:
+    """ Test simulate """
+
+    counts = [0, 1, 1, 2, 1, 0, 0, 0, 0]
+
+    assert simulate(counts, [0, 18, 80, 256]) == [5, 26, 5934, 26984457539]
+    assert simulate(counts, [256], 1000) == [539]
+    assert simulate(counts, list(range(100))) == [
+        count_fish(counts, day) for day in range(100)
+    ]
+    assert simulate([0, 1, 0, 0, 0], list(range(30)), None, 4, 2) == [
+        count_fish([0, 1, 0, 0, 0], day, None, 4, 2) for day in range(30)
+    ]
+    assert simulate([0, 0, 0, 1, 0, 0, 0, 0, 0, 1], list(range(30))) == [
+        count_fish([0, 0, 0, 1, 0, 0, 0, 0, 0, 1], day) for day in range(30)
+    ]
+
+    # A short lifecycle still keeps slots for the oldest starting fish
+    assert simulate([0, 1, 1, 2, 1], [30], None, 2, 3) == [
+        sum(descendants(age, 30, 2, 3) for age in [3, 4, 3, 1, 2])
+    ]
+
+
+# --------------------------------------------------
+def read_schools(text: str, size: int = NEWBORN + 1) -> np.ndarray:
+    """ Count the ages on each line into an (S x size) or wider array """
+
+    lines = [line for line in text.splitlines() if line.strip()]
+    ages = np.fromstring(','.join(lines), dtype=np.int64, sep=',')
+    if ages.size and ages.min() < 0:
+        raise ValueError('Ages must be at least 0')
+
+    size = max(size, int(ages.max(initial=0)) + 1)
+
+    # Number each age by its line so one bincount fills every school
+    school = np.repeat(np.arange(len(lines)),
+                       [line.count(',') + 1 for line in lines])
+    counts = np.bincount(school * size + ages, minlength=len(lines) * size)
+
+    return counts.reshape(len(lines), size)
+
+
+# --------------------------------------------------
+def test_read_schools() -> None:
+    """ Test read_schools """
+
+    assert read_schools('3,4,3,1,2\n\n8,0,0\n').tolist() == [
+        [0, 1, 1, 2, 1, 0, 0, 0, 0],
+        [2, 0, 0, 0, 0, 0, 0, 0, 1],
+    ]
+    assert read_schools('').shape == (0, 9)
+    assert read_schools('9,3', 7).tolist() == [[0, 0, 0, 1, 0, 0, 0, 0, 0, 1]]
+
+
+# --------------------------------------------------
+def simulate_batch(counts: np.ndarray,
+                   days: List[int],
+                   mod: Optional[int] = None,
+                   reset: int = RESET,
+                   newborn: int = NEWBORN) -> np.ndarray:
+    """ Count the fish of each school on each of the sorted days """
+
+    # One fish at 0 grows the fastest, bounding the largest school's total
+    size = counts.shape[1]
+    if mod:
+        bound = 2 * size * mod
+    else:
+        bound = int(counts.sum(axis=1).max(initial=0)) * simulate(
+            [1] + [0] * (size - 1), days[-1:], None, reset, newborn)[0]
+    dtype = np.int64 if bound < 2**63 else object
+
+    # Ages run down the rows so each shift touches contiguous memory
+    ring = np.ascontiguousarray(counts.T, dtype=dtype)
+    totals = np.zeros((len(counts), len(days)), dtype=dtype)
+    head, day = 0, 0
+
+    for i, target in enumerate(days):
+        while day < target:
+            head = (head + 1) % size
+            last = (head + size - 1) % size
+            born = ring[last].copy()
+            ring[last] = 0
+            for age in reset, newborn:
+                ring[(head + age) % size] += born
+                if mod:
+                    ring[(head + age) % size] %= mod
+            day += 1
+
+        totals[:, i] = ring.sum(axis=0) % mod if mod else ring.sum(axis=0)
+
+    return totals
+
+
+# --------------------------------------------------
+def test_simulate_batch() -> None:
+    """ Test simulate_batch """
+
+    counts = read_schools('3,4,3,1,2\n0\n8,8')
+
+    assert simulate_batch(counts, [18, 80]).tolist() == [
+        simulate([0, 1, 1, 2, 1, 0, 0, 0, 0], [18, 80]),
+        simulate([1, 0, 0, 0, 0, 0, 0, 0, 0], [18, 80]),
+        simulate([0, 0, 0, 0, 0, 0, 0, 0, 2], [18, 80]),
+    ]
+
+    # Past int64 the counts are kept as Python ints
+    totals = simulate_batch(counts, [1000])
+    assert totals.dtype == object
+    assert totals[0, 0] == simulate([0, 1, 1, 2, 1, 0, 0, 0, 0], [1000])[0]
+
+    assert simulate_batch(counts, [256], 1000).tolist() == [[539], [
+        simulate([1, 0, 0, 0, 0, 0, 0, 0, 0], [256], 1000)[0]
+    ], [simulate([0, 0, 0, 0, 0, 0, 0, 0, 2], [256], 1000)[0]]]
+
+    counts = read_schools('1\n4,0', 5)
+    assert simulate_batch(counts, [30], None, 4, 2).tolist() == [
+        [descendants(1, 30, 4, 2)],
+        [descendants(4, 30, 4, 2) + descendants(0, 30, 4, 2)],
+    ]
+
+
+# --------------------------------------------------
+def save_series(filename: str, days: List[int], totals: List[int]) -> None:
+    """ Save the counts as day and fish columns """
+
+    # Counts past uint64 need Python ints, which NumPy must pickle
+    fits = all(total < 2**64 for total in totals)
+    series = np.zeros(len(days),
+                      dtype=[('day', np.int64),
+                             ('fish', np.uint64 if fits else object)])
+    series['day'] = days
+    series['fish'] = totals
+
+    np.save(filename, series, allow_pickle=not fits)
+
+
+# --------------------------------------------------
+def count_fish(counts: List[int],
+               days: int,
+               mod: Optional[int] = None,
+               reset: int = RESET,
+               newborn: int = NEWBORN) -> int:
+    """ Count the fish after days from the counts for each age """
+
+    power = mat_pow(transition(reset, newborn, len(counts)), days, mod)
+    total = sum(sum(row[age] * num for age, num in enumerate(counts))
+                for row in power)
+
+    return total % mod if mod else total
+
+
+# --------------------------------------------------
+def test_count_fish() -> None:
+    """ Test count_fish """
+
+    counts = [0, 1, 1, 2, 1, 0, 0, 0, 0]
+
+    assert count_fish(counts, 0) == 5
+    assert count_fish(counts, 18) == 26
+    assert count_fish(counts, 80) == 5934
+    assert count_fish(counts, 256) == 26984457539
+    assert count_fish(counts, 256, 1000) == 539
+    assert count_fish([0, 1, 0, 0, 0], 30, None, 4, 2) == descendants(
+        1, 30, 4, 2)
+
+    # Fish older than a newborn widen the ages past the lifecycle
+    assert count_fish([0, 0, 0, 1, 0, 0, 0, 0, 0, 1], 5) == 3
+
+
+# --------------------------------------------------
+def transition(reset: int = RESET,
+               newborn: int = NEWBORN,
+               size: Optional[int] = None) -> Matrix:
+    """ The matrix taking the counts for each age to the next day's """
+
+    # Every age counts down, and each fish at 0 resets and spawns a newborn
+    size = size or max(reset, newborn) + 1
+    matrix = [[0] * size for _ in range(size)]
+    for age in range(size - 1):
+        matrix[age][age + 1] = 1
+    matrix[reset][0] += 1
+    matrix[newborn][0] += 1
+
+    return matrix
+
+
+# --------------------------------------------------
+def mat_mult(a: Matrix, b: Matrix, mod: Optional[int] = None) -> Matrix:
+    """ Multiply two square matrices """
+
+    cols = list(zip(*b))
+    product = [[sum(x * y for x, y in zip(row, col)) for col in cols]
+               for row in a]
+
+    return [[n % mod for n in row] for row in product] if mod else product
+
+
+# --------------------------------------------------
+def mat_pow(matrix: Matrix, power: int, mod: Optional[int] = None) -> Matrix:
+    """ Raise a square matrix to a power by repeated squaring """
+
+    result = [[int(i == j) for j in range(len(matrix))]
+              for i in range(len(matrix))]
+
+    while power:
+        if power & 1:
+            result = mat_mult(result, matrix, mod)
+        matrix = mat_mult(matrix, matrix, mod)
+        power >>= 1
+
+    return result
+
+
+# --------------------------------------------------
+def test_mat_pow() -> None:
+    """ Test mat_pow """
+
+    fib = [[1, 1], [1, 0]]
+
+    assert mat_pow(fib, 0) == [[1, 0], [0, 1]]
+    assert mat_pow(fib, 10) == [[89, 55], [55, 34]]
+    assert mat_pow(fib, 10, 7) == [[5, 6], [6, 6]]
 
 
 # --------------------------------------------------
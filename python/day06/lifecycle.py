@@ -0,0 +1,112 @@
+"""
+Author : Ken Youens-Clark <kyclark@gmail.com>
+Date   : 2021-12-06
+Purpose: Memoized lanternfish descendant counts shared by both solutions
+"""
+
+import sqlite3
+from collections import Counter
+from typing import Dict, List, Optional, Tuple
+
+RESET = 6
+NEWBORN = 8
+
+# The fish counts from one fish at 0 for each number of days by lifecycle
+_tables: Dict[Tuple[int, int], List[int]] = {}
+
+
+# --------------------------------------------------
+def descendants(timer: int,
+                days: int,
+                reset: int = RESET,
+                newborn: int = NEWBORN) -> int:
+    """ Count one fish and its descendants after days """
+
+    # A fish at timer is a fish at 0 with timer fewer days to go
+    if days <= timer:
+        return 1
+
+    table = _tables.setdefault((reset, newborn), [1])
+    for day in range(len(table), days - timer + 1):
+        # A fish at 0 becomes one at reset and one at newborn next day
+        table.append(
+            (table[day - 1 - reset] if day > reset else 1) +
+            (table[day - 1 - newborn] if day > newborn else 1))
+
+    return table[days - timer]
+
+
+# --------------------------------------------------
+def test_descendants() -> None:
+    """ Test descendants """
+
+    assert descendants(3, 3) == 1
+    assert descendants(3, 4) == 2
+    assert descendants(0, 8) == 3
+    assert sum(descendants(t, 18) for t in [3, 4, 3, 1, 2]) == 26
+    assert sum(descendants(t, 256) for t in [3, 4, 3, 1, 2]) == 26984457539
+
+    # Every fish spawns daily with a reset and newborn of 0
+    assert descendants(0, 10, 0, 0) == 2**10
+    assert descendants(2, 5, 1, 2) == 3
+
+
+# --------------------------------------------------
+def open_cache(filename: str) -> sqlite3.Connection:
+    """ Open the on-disk cache, creating it if needed """
+
+    conn = sqlite3.connect(filename, timeout=60)
+    conn.execute('create table if not exists descendants ('
+                 'timer integer, days integer, reset integer, '
+                 'newborn integer, fish text, '
+                 'primary key (timer, days, reset, newborn))')
+
+    return conn
+
+
+# --------------------------------------------------
+def count_school(ages: List[int],
+                 days: int,
+                 reset: int = RESET,
+                 newborn: int = NEWBORN,
+                 cache: Optional[sqlite3.Connection] = None) -> int:
+    """ Count the fish from a school after days """
+
+    total = 0
+    for timer, num in Counter(ages).items():
+        key = (timer, days, reset, newborn)
+        row = cache.execute(
+            'select fish from descendants where timer = ? and days = ? '
+            'and reset = ? and newborn = ?', key).fetchone() if cache else None
+
+        if row:
+            fish = int(row[0])
+        else:
+            fish = descendants(*key)
+            if cache:
+                # Counts outgrow sqlite integers, so store them as text
+                with cache:
+                    cache.execute(
+                        'insert or ignore into descendants '
+                        'values (?, ?, ?, ?, ?)', (*key, str(fish)))
+
+        total += fish * num
+
+    return total
+
+
+# --------------------------------------------------
+def test_count_school(tmp_path) -> None:
+    """ Test count_school """
+
+    ages = [3, 4, 3, 1, 2]
+    filename = str(tmp_path / 'fish.db')
+
+    assert count_school(ages, 80) == 5934
+    assert count_school(ages, 256, cache=open_cache(filename)) == 26984457539
+
+    # The second run reads the cache rather than computing
+    cache = open_cache(filename)
+    cache.execute("update descendants set fish = '0' where timer = 3")
+    assert count_school(ages, 256,
+                        cache=cache) == 26984457539 - 2 * descendants(3, 256)
@@ -7,12 +7,14 @@ Purpose: Rock the Casbah
 
 import argparse
 import os
+import numpy as np
 from typing import NamedTuple, TextIO
 
 
 class Args(NamedTuple):
     """ Command-line arguments """
     state: str
+    median: bool
 
 
 # --------------------------------------------------
@@ -25,12 +27,17 @@ def get_args() -> Args:
 
     parser.add_argument('positions', metavar='STR', help='Starting positions')
 
+    parser.add_argument('-m',
+                        '--median',
+                        help='Align at the median, found by selection',
+                        action='store_true')
+
     args = parser.parse_args()
 
     if os.path.isfile(args.positions):
         args.positions = open(args.positions).read().rstrip()
 
-    return Args(args.positions)
+    return Args(args.positions, args.median)
 
 
 # --------------------------------------------------
@@ -38,6 +45,12 @@ def main() -> None:
     """ Make a jazz noise here """
 
     args = get_args()
+
+    if args.median:
+        pos = np.fromstring(args.state, dtype=np.int64, sep=',')
+        print(median_fuel(pos))
+        return
+
     pos = list(sorted(map(int, args.state.split(','))))
     costs = []
 
@@ -49,6 +62,31 @@ def main() -> None:
     print(sorted(costs)[0])
 
 
+# --------------------------------------------------
+def median_fuel(pos: np.ndarray) -> int:
+    """ Total fuel for all crabs to move to the median """
+
+    # Partition in place so the lower half sits below the median
+    mid = (len(pos) - 1) // 2
+    pos.partition(mid)
+    median = int(pos[mid])
+
+    return (median * (mid + 1) - int(pos[:mid + 1].sum()) +
+            int(pos[mid + 1:].sum()) - median * (len(pos) - mid - 1))
+
+
+# --------------------------------------------------
+def test_median_fuel() -> None:
+    """ Test median_fuel """
+
+    pos = np.array([16, 1, 2, 0, 4, 2, 7, 1, 2, 14])
+
+    assert median_fuel(pos) == 37
+    assert median_fuel(np.array([5])) == 0
+    assert median_fuel(np.array([1, 10])) == 9
+    assert median_fuel(np.array([3, 1, 2, 9])) == 9
+
+
 # --------------------------------------------------
 if __name__ == '__main__':
     main()